@@ -84,19 +84,10 @@ def display_habit():
                            columns = ("user_id", "event_title", "assigned_date"),
                            data = habit_data)
 
-            st.session_state['events_loaded'] = False
             st.rerun()
 
     # Extract all events
-    if ('events_loaded' not in st.session_state) or (st.session_state['events_loaded'] == False):
-        events = mf.query_select("events", columns = ("event_id", "event_title", "assigned_date", "completed"))
-
-        # Cache the grouped events and mark as loaded
-        st.session_state['events'] = events
-        st.session_state['events_loaded'] = True
-    else:
-        # Retrieve cached grouped events
-        events = st.session_state['events']
+    events = mf.load_events()
 
     formatted_events = [
         {
@@ -60,19 +60,8 @@ def display_journal():
     #         return frame
 
     
-    # TODO put this into mello functions -- repeated code from habit.py
     # Get all events due for today
-    if ('events_loaded' not in st.session_state) or (st.session_state['events_loaded'] == False):
-        events = mf.query_select("events", columns = ("event_id", "event_title", "assigned_date", "completed"))
-
-        # Cache the grouped events and mark as loaded
-        st.session_state['events'] = events
-        st.session_state['events_loaded'] = True
-    else:
-        # Retrieve cached grouped events
-        events = st.session_state['events']
-
-    todays_events = events[events['ASSIGNED_DATE'] == datetime.today().date()]
+    todays_events = mf.load_events(datetime.today().date())
     
 
     # Example prompts for the user
@@ -143,9 +132,12 @@ def display_journal():
         # Adds the habits to the Journal page which can be ticked when completed
         st.subheader("To Do:")
         if not todays_events.empty:
-            for index, event in todays_events.iterrows():
-                checkbox_key = f'eventcheck_{index}'
+            for _, event in todays_events.iterrows():
+                checkbox_key = f'eventcheck_{event["EVENT_ID"]}'
                 is_checked = st.session_state['habit_status'].get(checkbox_key)
+                if is_checked is None:
+                    # Start from the saved state so unticking a completed habit can be submitted
+                    is_checked = bool(event['COMPLETED'])
                 completed = st.checkbox(label = event["EVENT_TITLE"], key=checkbox_key, value=is_checked)
                 st.session_state['habit_status'][checkbox_key] = completed
         else:
@@ -163,114 +155,77 @@ def display_journal():
 
         with st.spinner('Processing your Journal...'):
 
-            # Update the events database to show these have been completed in the calendar
-            for index, event in todays_events.iterrows():
-                checkbox_key = f'eventcheck_{index}'
-                if st.session_state.get(checkbox_key):  # Check if the checkbox is checked
-                    mf.update_data(
-                        table_name="events",
-                        column_to_update="completed",
-                        new_value=True,
-                        condition_column="event_id",
-                        condition_value=event['EVENT_ID']
-                    )
-            
+            # Update the events database to show which have been completed in the calendar
+            completion_changes = {}
+            for _, event in todays_events.iterrows():
+                checkbox_key = f'eventcheck_{event["EVENT_ID"]}'
+                is_checked = bool(st.session_state.get(checkbox_key))
+                # Only send events whose state actually changed
+                if is_checked != bool(event['COMPLETED']):
+                    completion_changes[int(event['EVENT_ID'])] = is_checked
+
+            # Saving the habits and analysing the entry don't depend on each other, so run them at the same time
+            stages = mf.run_stages({
+                "update_habits": (lambda: mf.bulk_update_data(
+                    table_name="events",
+                    column_to_update="completed",
+                    condition_column="event_id",
+                    new_values=completion_changes
+                ), mf.get_setting("HABIT_UPDATE_TIMEOUT", 15, cast=float)),
+                "analyze_emotions": (lambda: mf.analyze_emotions(journal_entry, user_id),
+                                     mf.get_setting("EMOTION_ANALYSIS_TIMEOUT", 30, cast=float)),
+            }, metric="journal_submit")
+
+            if stages["update_habits"]["error"] is not None:
+                st.error(f"Error saving your habits: {stages['update_habits']['error']}")
+
             # Get the date of when the journal is written
             journal_date = datetime.now().date()
 
-            # Analyze the journal entry to extract emotions using the analyze emotions function
-            result = mf.analyze_emotions(journal_entry)
-
-            # Store the result in the emotions session state
-            st.session_state['emotions'] = result
-
-            # Extract the emotion scores from the journal entry
-            angry_score = result.get('Angry', 0.0)
-            fear_score = result.get('Fear', 0.0)
-            happy_score = result.get('Happy', 0.0)
-            sad_score = result.get('Sad', 0.0)
-            surprise_score = result.get('Surprise', 0.0)
-
-            # Insert the emotions extracted into the journal entries table to use in the dashboard
-            try:
-                mf.insert_data("JOURNAL_ENTRIES", columns = ('user_id', 'date_created', 'journal_entry', 'angry', 'fear', 'happy', 'sad', 'surprise'), data = (str(user_id), journal_date, journal_entry, angry_score, fear_score, happy_score, sad_score, surprise_score))
-            except Exception as e:
-                st.error(f"Error submitting journal entry: {e}")
-
-                    
-            # Change the events loaded session state to false
-            st.session_state['events_loaded'] = False
-
-            # Play meow when the journal has been processed
-            #mf.meow()
-
-            # Success message
-            # Inject CSS styles
-            st.markdown(
-                """
-                <style>
-                /* From Uiverse.io by andrew-demchenk0 */ 
-                .success {
-                    font-family: system-ui, -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, 'Open Sans', 'Helvetica Neue', sans-serif;
-                    width: 320px;
-                    padding: 12px;
-                    display: flex;
-                    flex-direction: row;
-                    align-items: center;
-                    justify-content: start;
-                    background: #EDFBD8;
-                    border-radius: 8px;
-                    border: 1px solid #84D65A;
-                    box-shadow: 0px 0px 5px -3px #111;
-                    margin-bottom: 20px;
-                }
-
-                .success__icon {
-                    width: 35px;
-                    height: 35px;
-                    transform: translateY(-2px);
-                    margin-right: 8px;
-                }
-
-                .success__icon path {
-                    fill: #84D65A;
-                }
-
-                .success__title {
-                    font-weight: 500;
-                    font-size: 14px;
-                    color: #2B641E;
-                    margin-left: 10px;
-                }
-
-                .success__close {
-                    width: 20px;
-                    height: 20px;
-                    cursor: pointer;
-                    margin-left: auto;
-                }
-
-                .success__close path {
-                    fill: #2B641E;
-                }
-                </style>
-                """,
-                unsafe_allow_html=True,
-            )
-
-            super_mimi = mf.import_html_media("assets/mimi-icons/super-mimi.png")
-
-            st.markdown(
-                f"""
-                <div class="success">
-                    <div class="success__icon">
-                        <img src="data:image/png;base64,{super_mimi}" alt="Success Icon" style="width: 35px; height: 35px; margin-right: 8px;" />
+            # Without emotions the entry can't be charted, so it isn't saved; resubmitting reuses any cached analysis
+            if stages["analyze_emotions"]["error"] is not None:
+                st.error(f"Error analysing your journal entry: {stages['analyze_emotions']['error']}")
+            else:
+                result = stages["analyze_emotions"]["result"]
+
+                # Start Mimi's reply to this entry now so it's ready by the time the Mimi page opens
+                st.session_state['journal_responded'] = False
+                mf.prefetch_journal_reply(journal_entry)
+
+                # Store the result in the emotions session state
+                st.session_state['emotions'] = result
+
+                # Extract the emotion scores from the journal entry
+                angry_score = result.get('Angry', 0.0)
+                fear_score = result.get('Fear', 0.0)
+                happy_score = result.get('Happy', 0.0)
+                sad_score = result.get('Sad', 0.0)
+                surprise_score = result.get('Surprise', 0.0)
+
+                # Insert the emotions extracted into the journal entries table to use in the dashboard
+                try:
+                    mf.insert_data("JOURNAL_ENTRIES", columns = ('user_id', 'date_created', 'journal_entry', 'angry', 'fear', 'happy', 'sad', 'surprise'), data = (str(user_id), journal_date, journal_entry, angry_score, fear_score, happy_score, sad_score, surprise_score))
+                except Exception as e:
+                    st.error(f"Error submitting journal entry: {e}")
+
+
+                # Play meow when the journal has been processed
+                #mf.meow()
+
+                # Success message
+                super_mimi = mf.media_src("assets/mimi-icons/super-mimi.png")
+
+                st.markdown(
+                    f"""
+                    <div class="success">
+                        <div class="success__icon">
+                            <img src="{super_mimi}" alt="Success Icon" />
+                        </div>
+                        <div class="success__title">Journal submitted - Head to Mimi!</div>
                     </div>
-                    <div class="success__title">Journal submitted - Head to Mimi!</div>
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
+                    """,
+                    unsafe_allow_html=True,
+                )
 
 # else:
 #     # Only one journal can be submitted each day
@@ -64,9 +64,19 @@ def display_mimi():
         st.info('Please go to the Journal page and enter your notes for today. Mimi will respond once you have submitted a journal entry.')
     else:
         if not st.session_state['journal_responded']:
-            #Generate a response to the journal entry
-            initial_prompt = f"Based on the user's journal entry today:\n\n'{journal_text}'\n\nAct as a therapist and provide supportive adivce and guidance using CBT techniques."
-            st.session_state['journal_response'] = mf.get_completion(prompt=initial_prompt, model='gpt-4o-mini', temperature=0.7)
+            # Use the reply started when the journal was submitted, if it's ready
+            prefetched_reply = mf.take_prefetched_journal_reply(journal_text)
+
+            if prefetched_reply is not None:
+                st.session_state['journal_response'] = prefetched_reply
+            else:
+                #Generate a response to the journal entry
+                initial_prompt = mf.journal_reply_prompt(journal_text)
+                st.session_state['journal_response'], streamed_bubble = mf.stream_chat_reply(
+                    mf.stream_completion(prompt=initial_prompt, model='gpt-4o-mini', temperature=0.7))
+
+                # The reply is shown again with the rest of the chat below
+                streamed_bubble.empty()
 
 
             #Add Mimi's response to chat history
@@ -75,32 +85,6 @@ def display_mimi():
             st.session_state['journal_responded'] = True
 
 
-    # Add chat interface with scrollable history
-    st.markdown(
-        """
-        <style>
-            .chat-history {
-                max-height: 400px;
-                overflow-y: auto;
-                padding: 10px;
-                border: 1px solid #ddd;
-                border-radius: 5px;
-            }
-            .chat-history .message {
-                margin-bottom: 15px;
-            }
-            .chat-history .user {
-                text-align: right;
-                color: #333;
-            }
-            .chat-history .mimi {
-                text-align: left;
-                color: #444;
-            }
-        </style>
-        """, unsafe_allow_html=True
-    )
-
     # After journal response, allow the user to ask questions
     if journal_text and st.session_state['journal_responded']:
             # Check if the user has asked fewer than 10 questions
@@ -136,8 +120,6 @@ def display_mimi():
                                         mf.insert_data("EVENTS", columns = ('user_id', 'event_title', 'assigned_date'), data = (str(user_id), event['title'], event_date))
                                     except Exception as e:
                                         st.error(f"Error submitting event entry: {e}")
-
-                                    st.session_state['events_loaded'] = False
         
                 # User input field
             
@@ -149,21 +131,12 @@ def display_mimi():
                     st.session_state['question_count'] += 1
                     st.session_state['chat_history'].append(('user', user_input))
 
-           
-
-                    # Get the chatbot's response using the OpenAI API
-                    response = mf.get_completion(prompt=user_input, model="gpt-4o-mini", temperature=0.7)
-                        
-                    
-                    # Save the new question and response to history
-                    st.session_state['chat_history'].append(('Mimi', response))
-
 
                     # Display the journal entry at the top of the page
                 if journal_text:
                     st.markdown(
                         f"""
-                        <div style="background-color: #dbfeff; border-radius: 10px; padding: 10px; margin: 5px 0; max-width: 80%; margin-left: auto; margin-right: 0;">
+                        <div class="chat-bubble user">
                             <h3>Journal Entry:</h3>
                             <p>{journal_text}</p>
                         </div>
@@ -172,22 +145,15 @@ def display_mimi():
 
 
                 for role, message in st.session_state['chat_history']:
-                    if role == 'user':
-                        st.markdown(
-                                    f"""
-                                    <div style="background-color: #dbfeff; border-radius: 10px; padding: 10px; margin: 5px 0; max-width: 80%; margin-left: auto; margin-right: 0;">
-                                        <span style="font-size: 18px;">💬</span> <b>You:</b> {message}
-                                    </div>
-                                    """, unsafe_allow_html=True
-                                )
-                    elif role == 'Mimi':
-                        st.markdown(
-                                    f"""
-                                    <div style="background-color: #F1F0F0; border-radius: 10px; padding: 10px; margin: 5px 0; max-width: 80%; margin-left: 0; margin-right: auto;">
-                                        <span style="font-size: 18px;">🐱</span> <b>Mimi:</b> {message}
-                                    </div>
-                                    """, unsafe_allow_html=True
-                                )
+                    st.markdown(mf.chat_bubble(role, message), unsafe_allow_html=True)
+
+                if user_input:
+                    # Stream the chatbot's response from the OpenAI API below the question
+                    response, _ = mf.stream_chat_reply(
+                        mf.stream_completion(prompt=user_input, model="gpt-4o-mini", temperature=0.7))
+
+                    # Save the new response to history
+                    st.session_state['chat_history'].append(('Mimi', response))
 
                 st.markdown('</div>', unsafe_allow_html=True)
 
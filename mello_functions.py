@@ -1,16 +1,64 @@
 import streamlit as st
-import snowflake.connector
-from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
+import numpy as np
+import pyarrow as pa
 import os
 import base64
+import hashlib
+import unicodedata
+import io
+import mimetypes
 import bcrypt
 import json 
 import re
-import openai
-from pygame import mixer
-import requests
-from bs4 import BeautifulSoup
+import threading
+import time
+import atexit
+import sqlite3
+from datetime import date
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from urllib.parse import quote
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+try:
+    import resource
+except ImportError:
+    # Unix only; chart workers then report no memory figures
+    resource = None
+
+# snowflake.connector, openai, matplotlib/seaborn and requests/bs4 are imported inside the functions that use them:
+# together they take seconds to load, and the login screen and the worker processes need none of them
+
+
+def get_setting(key: str, default=None, cast=None):
+    """
+    Reads an optional app setting from Streamlit secrets, falling back to environment variables.
+
+    Params:
+        key (str): Name of the setting.
+        default: Value returned when the setting is not configured.
+        cast (callable, optional): Converts the raw value (e.g. int, float).
+
+    Returns:
+        The configured value, or the default.
+    """
+    try:
+        value = st.secrets.get(key)
+    except FileNotFoundError:
+        # No secrets.toml available (e.g. local runs and benchmarks)
+        value = None
+
+    if value is None:
+        value = os.environ.get(key, default)
+
+    if value is not None and cast is not None:
+        value = cast(value)
+
+    return value
 
 def get_db_connection():
 
@@ -41,6 +89,8 @@ def get_db_connection():
     DATABASE = "MELLOAPPLICATIONDATA"
     SCHEMA = "APP_SCHEMA"
 
+    import snowflake.connector
+
     ##Establishing the connection and cursor to be used to execute the API requests:
     ctx = snowflake.connector.connect(
             user=USER,
@@ -48,442 +98,2418 @@ def get_db_connection():
             account=ACCOUNT,
             warehouse=WAREHOUSE,
             database=DATABASE,
-            schema =SCHEMA
+            schema =SCHEMA,
+            # Heartbeat so pooled sessions don't expire while sitting idle
+            client_session_keep_alive=True
         )
     
     return ctx
 
-def query_select(table_title: str, columns: tuple, user_id: int = None, username: str = None) -> pd.DataFrame:
+
+class StorageBackend:
     """
-    Extracts data from a Snowflake table based on specific user criteria using the SQL SELECT function.
-    
-    Params:
-        table_title (str): Title of Snowflake table to select information from.
-        user_id (int, optional): User ID to filter data.
-        username (str, optional): Username to filter data.
-        columns (str): Column data to extract.
-        
-    Returns:
-        pd.DataFrame: Data retrieved from the query, or an empty DataFrame if no data is found.
+    Interface for the database behind query_select, insert_data, insert_multiple_data and update_data.
+
+    Queries are written once with %s placeholders; each backend adapts them to its own driver.
     """
 
-    table_title = table_title.upper()
+    name = None
 
-    # Ensure at least one filter criterion is provided
-    if not user_id and not username:
-        try:
-            user_id = int(st.session_state['user_id'])
-        except:
-            raise ValueError("user_id in session state is not defined. Either user_id or username must be provided to filter the query.")
+    def connect(self):
+        """
+        Opens a new DB-API connection exposing cursor(), commit(), rollback(), close() and is_closed().
+        """
+        raise NotImplementedError
 
-    # Check if columns is provided
-    if columns:
-        # Ensure that columns are treated as a list of strings (even if there's only one column)
-        if isinstance(columns, str) or len(columns) == 1:
-            # If columns is a single string, don't join
-            columns_str = columns
+    def prepare(self, query: str) -> str:
+        """
+        Converts a query written with %s placeholders to the backend's parameter style.
+        """
+        return query
+
+    def fetch_dataframe(self, cursor) -> pd.DataFrame:
+        """
+        Reads the executed cursor's result into a DataFrame with upper-case column names.
+        """
+        raise NotImplementedError
+
+    def execute_insert_returning(self, cursor, table_title: str, columns: tuple, insert_query: str, data: tuple,
+                                 key_column: str):
+        """
+        Runs a single-row INSERT and returns the key generated for it, in one round trip.
+        """
+        raise NotImplementedError
+
+    def day_number(self, expression: str) -> str:
+        """
+        SQL turning a DATE expression into a whole day count, so consecutive days differ by 1.
+        """
+        raise NotImplementedError
+
+    def fetch_dataframe_batches(self, cursor, batch_size: int):
+        """
+        Yields the executed cursor's result as DataFrame chunks.
+        """
+        raise NotImplementedError
+
+    def fetch_arrow_batches(self, cursor, batch_size: int):
+        """
+        Yields the executed cursor's result as pyarrow Tables.
+        """
+        raise NotImplementedError
+
+
+class SnowflakeBackend(StorageBackend):
+    """
+    The production Snowflake warehouse.
+    """
+
+    name = "snowflake"
+
+    def connect(self):
+        return get_db_connection()
+
+    def fetch_dataframe(self, cursor) -> pd.DataFrame:
+        return cursor.fetch_pandas_all()
+
+    def execute_insert_returning(self, cursor, table_title: str, columns: tuple, insert_query: str, data: tuple,
+                                 key_column: str):
+        # Snowflake has no RETURNING, so the INSERT and a lookup of the new row go in one multi-statement request
+        matches = ' AND '.join(f"EQUAL_NULL({column}, %s)" for column in columns)
+        lookup_query = f"SELECT MAX({key_column}) FROM {table_title} WHERE {matches}"
+
+        cursor.execute(insert_query + '; ' + lookup_query, tuple(data) * 2, num_statements=2)
+        cursor.nextset()
+        return cursor.fetchone()[0]
+
+    def day_number(self, expression: str) -> str:
+        return f"DATEDIFF(day, '1970-01-01', {expression})"
+
+    def fetch_dataframe_batches(self, cursor, batch_size: int):
+        # Snowflake decides the chunk sizes itself
+        yield from cursor.fetch_pandas_batches()
+
+    def fetch_arrow_batches(self, cursor, batch_size: int):
+        for batch in cursor.fetch_arrow_batches():
+            yield batch
+
+
+# Mirror of the Snowflake tables used by the app
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS USER_ACCOUNTS (
+    USER_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    USERNAME TEXT NOT NULL UNIQUE,
+    NAME TEXT,
+    DATA_PERMISSION BOOLEAN,
+    PASSWORD_HASH TEXT
+);
+
+CREATE TABLE IF NOT EXISTS JOURNAL_ENTRIES (
+    ENTRY_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    USER_ID INTEGER NOT NULL,
+    DATE_CREATED DATE,
+    JOURNAL_ENTRY TEXT,
+    ANGRY REAL,
+    FEAR REAL,
+    HAPPY REAL,
+    SAD REAL,
+    SURPRISE REAL
+);
+
+CREATE TABLE IF NOT EXISTS EVENTS (
+    EVENT_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    USER_ID INTEGER NOT NULL,
+    EVENT_TITLE TEXT,
+    ASSIGNED_DATE DATE,
+    COMPLETED BOOLEAN DEFAULT FALSE
+);
+
+CREATE INDEX IF NOT EXISTS JOURNAL_ENTRIES_USER_DATE ON JOURNAL_ENTRIES (USER_ID, DATE_CREATED);
+CREATE INDEX IF NOT EXISTS EVENTS_USER_DATE ON EVENTS (USER_ID, ASSIGNED_DATE);
+"""
+
+
+class _SQLiteConnection:
+    """
+    Wraps a sqlite3 connection with the is_closed() check the connection pool relies on.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._closed = False
+
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def close(self):
+        self._closed = True
+        self._conn.close()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Local embedded database for offline development, load tests and benchmarks.
+
+    The tables are created on first connection. Dates and booleans round-trip as Python
+    date and bool values so pages see the same types as with Snowflake.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = "mello_local.sqlite3"):
+        self.path = path
+        self._schema_ready = False
+        self._lock = threading.Lock()
+
+        sqlite3.register_adapter(date, lambda value: value.isoformat())
+        sqlite3.register_adapter(bool, int)
+        # Values taken straight out of DataFrames arrive as numpy scalars
+        sqlite3.register_adapter(np.int64, int)
+        sqlite3.register_adapter(np.int32, int)
+        sqlite3.register_adapter(np.bool_, bool)
+        sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()))
+        sqlite3.register_converter("BOOLEAN", lambda value: bool(int(value)))
+
+    def connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            # Pooled connections are shared between Streamlit's script threads
+            check_same_thread=False,
+            uri=self.path.startswith("file:")
+        )
+
+        with self._lock:
+            if not self._schema_ready:
+                conn.executescript(SQLITE_SCHEMA)
+                conn.commit()
+                self._schema_ready = True
+
+        return _SQLiteConnection(conn)
+
+    def prepare(self, query: str) -> str:
+        return query.replace("%s", "?")
+
+    def fetch_dataframe(self, cursor) -> pd.DataFrame:
+        columns = [description[0].upper() for description in cursor.description]
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+
+    def execute_insert_returning(self, cursor, table_title: str, columns: tuple, insert_query: str, data: tuple,
+                                 key_column: str):
+        # Every table's key is its INTEGER PRIMARY KEY, i.e. the rowid
+        cursor.execute(self.prepare(insert_query), data)
+        return cursor.lastrowid
+
+    def day_number(self, expression: str) -> str:
+        return f"CAST(julianday({expression}) AS INTEGER)"
+
+    def fetch_dataframe_batches(self, cursor, batch_size: int):
+        columns = [description[0].upper() for description in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+    def fetch_arrow_batches(self, cursor, batch_size: int):
+        columns = [description[0].upper() for description in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield pa.Table.from_pydict({column: list(values) for column, values in zip(columns, zip(*rows))})
+
+
+STORAGE_BACKENDS = {
+    "snowflake": SnowflakeBackend,
+    "sqlite": SQLiteBackend,
+}
+
+_storage_backend = None
+
+
+def get_storage_backend() -> StorageBackend:
+    """
+    Returns the configured storage backend (STORAGE_BACKEND setting, Snowflake by default).
+    """
+    global _storage_backend
+
+    if _storage_backend is None:
+        name = get_setting("STORAGE_BACKEND", "snowflake").lower()
+        if name not in STORAGE_BACKENDS:
+            raise ValueError(f"Unknown STORAGE_BACKEND '{name}'. Choose from: {', '.join(STORAGE_BACKENDS)}")
+
+        if name == "sqlite":
+            _storage_backend = SQLiteBackend(get_setting("SQLITE_PATH", "mello_local.sqlite3"))
         else:
-            # Join the columns if it's a list of strings
-            columns_str = ", ".join(columns)
-    else:
-        # If no columns, use '*' to select all columns
-        columns_str = "*"
+            _storage_backend = STORAGE_BACKENDS[name]()
 
-    # Start constructing the query
-    query = 'SELECT ' + columns_str + ' FROM ' + table_title
+    return _storage_backend
 
-    # Add the WHERE clause based on the available parameters
-    filters = []
-    params = []
-    if user_id:
-        filters.append("USER_ID = %s")
-        params.append(user_id)
-    if username:
-        filters.append("USERNAME = %s")
-        params.append(username)
 
-    # Join filters with AND if both are provided
-    if filters:
-        query += ' WHERE ' + ' AND '.join(filters)
+# Snowflake error codes raised when a session or its auth token has expired
+SESSION_EXPIRED_ERRNOS = {390111, 390112, 390114}
 
-    # Create connection
-    conn = get_db_connection()
-    cursor = conn.cursor()
 
-    try:
-        # Execute the query with parameters
-        cursor.execute(query, params)
-        data = cursor.fetch_pandas_all()
-    except Exception as e:
-        print(f"Error executing query: {query}", e)
-        data = pd.DataFrame()  # Return an empty DataFrame on error
-    finally:
-        # Close connection
-        cursor.close()
-        conn.close()
+def is_session_expired(error: Exception) -> bool:
+    """
+    Checks whether a connector error means the session is gone and the connection must be replaced.
+    """
+    return getattr(error, "errno", None) in SESSION_EXPIRED_ERRNOS
 
-    return data
 
-def insert_data(table_title: str, columns: tuple, data: tuple):
+class ConnectionPool:
     """
-    Inserts a row of data into snowflake table
+    Bounded, thread-safe pool of database connections shared by every session in the process.
 
-    Params:
-        table_title (str): Title of snowflake table to select information from
-        columns (list): List of column titles 
-        data (str): 
+    Connections are health-checked when checked out, closed after sitting idle for too long,
+    and replaced transparently when their session has expired.
+    """
 
-    Returns:
-        None
+    def __init__(self, connect, max_size: int = 4, idle_timeout: float = 600, health_check_interval: float = 60,
+                 acquire_timeout: float = 30):
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+
+        # Idle connections as (connection, time returned to the pool), most recently used last
+        self._idle = []
+        self._open = 0
+        self._cond = threading.Condition()
+
+        self.stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_ms": 0.0,
+            "created": 0,
+            "reconnects": 0,
+            "health_check_failures": 0,
+            "evicted": 0,
+        }
+
+    def acquire(self):
+        """
+        Checks out a healthy connection, opening a new one if the pool is below its size limit.
+
+        Raises:
+            TimeoutError: If no connection becomes free within acquire_timeout seconds.
+        """
+        with self._cond:
+            self.stats["checkouts"] += 1
+            expired = self._evict_idle()
+
+            # Wait for a connection to be released when the pool is exhausted
+            started = time.perf_counter()
+            waited = False
+            while not self._idle and self._open >= self.max_size:
+                if not waited:
+                    self.stats["waits"] += 1
+                    waited = True
+                remaining = self.acquire_timeout - (time.perf_counter() - started)
+                if remaining <= 0:
+                    raise TimeoutError(f"No database connection available after {self.acquire_timeout}s")
+                self._cond.wait(remaining)
+            if waited:
+                self.stats["wait_time_ms"] += (time.perf_counter() - started) * 1000
+
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                # Reserve a slot for a new connection
+                conn, last_used = None, None
+                self._open += 1
+
+        # Closing, health checks and logins happen outside the lock so other sessions aren't blocked
+        for expired_conn in expired:
+            self._close_quietly(expired_conn)
+
+        if conn is not None and not self._is_healthy(conn, last_used):
+            self._close_quietly(conn)
+            conn = None
+            with self._cond:
+                self.stats["health_check_failures"] += 1
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self.stats["created"] += 1
+
+        return conn
+
+    def release(self, conn, discard: bool = False):
+        """
+        Returns a connection to the pool, or closes it if it is broken or discard is set.
+        """
+        if not discard:
+            try:
+                discard = conn.is_closed()
+            except Exception:
+                discard = True
+
+        if discard:
+            self._close_quietly(conn)
+
+        with self._cond:
+            if discard:
+                self._open -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def record_reconnect(self):
+        with self._cond:
+            self.stats["reconnects"] += 1
+
+    def close_all(self):
+        """
+        Closes every idle connection (used at interpreter exit).
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            return dict(self.stats, open=self._open, idle=len(self._idle), max_size=self.max_size)
+
+    def _evict_idle(self) -> list:
+        # Take out connections that have not been used for longer than idle_timeout (caller holds the lock);
+        # the caller closes the returned connections after releasing it, since closing can be a network round trip
+        now = time.monotonic()
+        keep, expired = [], []
+        for conn, last_used in self._idle:
+            if now - last_used > self.idle_timeout:
+                expired.append(conn)
+                self._open -= 1
+                self.stats["evicted"] += 1
+            else:
+                keep.append((conn, last_used))
+        self._idle = keep
+        return expired
+
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        try:
+            if conn.is_closed():
+                return False
+            # Only ping connections that have been idle for a while, to keep checkouts cheap
+            if time.monotonic() - last_used > self.health_check_interval:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT 1")
+                finally:
+                    cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
 
+
+def get_connection_pool() -> ConnectionPool:
+    """
+    Returns the process-wide connection pool, creating it on first use.
     """
+    global _connection_pool
 
-    # Validate the length of data matches columns
-    if len(columns) != len(data):
-        raise ValueError("The number of columns and data values must match.")
+    with _connection_pool_lock:
+        if _connection_pool is None:
+            _connection_pool = ConnectionPool(
+                get_storage_backend().connect,
+                max_size=get_setting("DB_POOL_SIZE", 4, cast=int),
+                idle_timeout=get_setting("DB_POOL_IDLE_TIMEOUT", 600, cast=float),
+                health_check_interval=get_setting("DB_POOL_HEALTH_CHECK_INTERVAL", 60, cast=float),
+                acquire_timeout=get_setting("DB_POOL_ACQUIRE_TIMEOUT", 30, cast=float),
+            )
+            atexit.register(_connection_pool.close_all)
 
-    # Join column names and create placeholders dynamically
-    columns_str = ', '.join(columns)
-    placeholders = ', '.join(["%s"] * len(columns))  # Create a placeholder for each column
+    return _connection_pool
 
-    # Construct the query string
-    insert_query = 'INSERT INTO ' + table_title + '(' + columns_str + ')' + ' VALUES ' + '(' + placeholders + ')'
 
-    # Set up the connection and execute the query
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute(insert_query, data)  # Pass data as parameters
-        conn.commit()
-    except Exception as e:
-        print(f"Error inserting data ({insert_query}):", e)
-        conn.rollback()  # Roll back in case of error
-    finally:
-        # Close the cursor and connection
-        cursor.close()
-        conn.close()
+def connection_pool_stats() -> dict:
+    """
+    Returns pool counters (checkouts, waits, reconnects, ...) and current open/idle connections.
+    """
+    return get_connection_pool().get_stats()
 
-def insert_multiple_data(table_title: str, columns: tuple, data: list):
+
+def run_with_connection(work, timer=None):
     """
-    Inserts multiple rows of data into a Snowflake table.
+    Runs work(conn) on a pooled connection and returns its result.
 
-    Params:
-        table_title (str): Title of Snowflake table to insert data into.
-        columns (tuple): Tuple of column names in the table.
-        data (list of tuples): List of tuples where each tuple represents a row to insert.
+    If the session has expired, the connection is replaced and the work is retried once.
+    When a DbCallTimer is given, the time spent waiting for the connection is recorded on it.
+    """
+    pool = get_connection_pool()
 
-    Returns:
-        None
+    for attempt in range(2):
+        if timer is not None:
+            with timer.phase("acquire"):
+                conn = pool.acquire()
+        else:
+            conn = pool.acquire()
+        try:
+            result = work(conn)
+        except Exception as e:
+            expired = is_session_expired(e)
+            pool.release(conn, discard=expired)
+            if expired and attempt == 0:
+                pool.record_reconnect()
+                continue
+            raise
+
+        pool.release(conn)
+        return result
+
+
+# Most recent database calls, oldest dropped first
+DB_CALL_LOG_SIZE = 2000
+_db_call_log = deque(maxlen=DB_CALL_LOG_SIZE)
+
+
+def _statement_shape(query: str) -> str:
+    # Collapse whitespace and variable-length placeholder lists so calls group by statement
+    shape = " ".join(query.split())
+    shape = re.sub(r"(WHEN %s THEN %s )+", "WHEN %s THEN %s ... ", shape)
+    shape = re.sub(r"\(%s(, %s)*\)", "(%s, ...)", shape)
+    return shape
+
+
+def _calling_page() -> str:
+    # First caller outside this module, e.g. "journal.py:display_journal"
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+class DbCallTimer:
+    """
+    Times the phases of one database call (acquire, execute, fetch) and records it in the call log.
     """
 
-    # Validate that data is a list of tuples
-    if not isinstance(data, list):
-        raise ValueError("Data must be a list of tuples.")
-    
-    if not all(isinstance(row, tuple) for row in data):
-        raise ValueError("Each element in data must be a tuple representing a row.")
-    
-    # Validate that each row of data matches the number of columns
-    if not all(len(columns) == len(row) for row in data):
-        raise ValueError("Each row of data must have the same number of elements as columns.")
+    def __init__(self, query: str, table: str):
+        self.started = time.perf_counter()
+        self.record = {
+            "timestamp": time.time(),
+            "statement": _statement_shape(query),
+            "table": table.upper(),
+            "page": _calling_page(),
+            "acquire_ms": 0.0,
+            "execute_ms": 0.0,
+            "fetch_ms": 0.0,
+            "total_ms": 0.0,
+            "rows": 0,
+            "bytes": 0,
+            "cached": False,
+            "error": None,
+        }
 
-    # Join column names and create placeholders dynamically
-    columns_str = ', '.join(columns)
-    placeholders = ', '.join(["%s"] * len(columns))  # Create a placeholder for each column
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record[f"{name}_ms"] += (time.perf_counter() - started) * 1000
 
-    # Construct the query string
-    insert_query = 'INSERT INTO ' + table_title + ' (' + columns_str + ')  VALUES (' + placeholders + ')'
+    def add_result(self, rows: int, size: int = 0):
+        self.record["rows"] += max(rows, 0)
+        self.record["bytes"] += size
 
-    # Set up the connection and execute the query
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    def finish(self, error: Exception = None, cached: bool = False):
+        if self.record["total_ms"]:
+            return
+        self.record["total_ms"] = (time.perf_counter() - self.started) * 1000
+        self.record["cached"] = cached
+        if error is not None:
+            self.record["error"] = f"{type(error).__name__}: {error}"
+        _db_call_log.append(self.record)
 
-    try:
-        # Execute the insert for all rows in data
-        cursor.executemany(insert_query, data)  # Use executemany for inserting multiple rows
-        conn.commit()
-    except Exception as e:
-        print(f"Error inserting data into {table_title}: {e}")
-        conn.rollback()  # Roll back in case of error
-    finally:
-        # Close the cursor and connection
-        cursor.close()
-        conn.close()
 
-def update_data(table_name: str, column_to_update: str, new_value: bool, condition_column: str, condition_value):
+def _dataframe_size(data: pd.DataFrame) -> int:
+    return int(data.memory_usage(deep=True).sum())
+
+
+def db_call_log() -> pd.DataFrame:
     """
-    Updates a column value in Snowflake based on a condition.
+    Returns the recorded database calls, oldest first.
+    """
+    return pd.DataFrame(list(_db_call_log))
 
-    Params:
-        table_name (str): Name of the Snowflake table.
-        column_to_update (str): Column to update.
-        new_value (bool): The new value to set (True or False).
-        condition_column (str): The column used to filter the rows.
-        condition_value: The value to match in the condition column.
+
+def db_call_summary() -> pd.DataFrame:
+    """
+    Summarizes the recorded database calls per statement shape.
 
     Returns:
-        None
+        pd.DataFrame: Calls, errors, cache hits, p50/p95 timings per phase, rows and bytes, slowest p95 first.
     """
-    # Create the SQL UPDATE query
-    update_query = f"""
-    UPDATE {table_name}
-    SET {column_to_update} = %s
-    WHERE {condition_column} = %s
+    log = db_call_log()
+    if log.empty:
+        return log
+
+    grouped = log.groupby("statement")
+    summary = pd.DataFrame({
+        "table": grouped["table"].first(),
+        "calls": grouped.size(),
+        "errors": grouped["error"].count(),
+        "cache_hits": grouped["cached"].sum(),
+        "pages": grouped["page"].agg(lambda pages: ", ".join(sorted(set(pages)))),
+    })
+    for column in ("total_ms", "acquire_ms", "execute_ms", "fetch_ms"):
+        summary[column.replace("_ms", "_p50_ms")] = grouped[column].quantile(0.5).round(2)
+        summary[column.replace("_ms", "_p95_ms")] = grouped[column].quantile(0.95).round(2)
+    summary["mean_rows"] = grouped["rows"].mean().round(1)
+    summary["total_bytes"] = grouped["bytes"].sum()
+
+    return summary.sort_values("total_p95_ms", ascending=False).reset_index()
+
+
+# Timings for non-database work (password hashing, rendering, API calls), oldest dropped first
+TIMING_LOG_SIZE = 2000
+_timing_log = deque(maxlen=TIMING_LOG_SIZE)
+
+
+def record_timing(metric: str, duration_ms: float, **details):
+    """
+    Records how long an operation took, with any extra details (sizes, counts, flags).
     """
+    _timing_log.append(dict(details, timestamp=time.time(), metric=metric, duration_ms=duration_ms))
 
-    # Set up the connection and execute the query
-    conn = get_db_connection() 
-    cursor = conn.cursor()
-    
-    try:
-        # Execute the update query with parameters
-        cursor.execute(update_query, (new_value, condition_value))
-        conn.commit()
-        print(f"Successfully updated {column_to_update} to {new_value} where {condition_column} = {condition_value}.")
-    except Exception as e:
-        print(f"Error updating data: {e}")
-        conn.rollback()  # Roll back in case of error
-    finally:
-        # Close the cursor and connection
-        cursor.close()
-        conn.close()
 
-# def import_html_media(media_path: str):
-#     # Encode the image in base64
-#     with open(media_path, "rb") as img_file:
-#         return base64.b64encode(img_file.read()).decode()
+def timing_summary() -> pd.DataFrame:
+    """
+    Summarizes recorded timings per metric with call counts and p50/p95/max durations.
+    """
+    log = pd.DataFrame(list(_timing_log))
+    if log.empty:
+        return log
 
+    grouped = log.groupby("metric")["duration_ms"]
+    return pd.DataFrame({
+        "calls": grouped.size(),
+        "p50_ms": grouped.quantile(0.5).round(2),
+        "p95_ms": grouped.quantile(0.95).round(2),
+        "max_ms": grouped.max().round(2),
+    }).reset_index()
 
-def import_html_media(media_path: str):
+
+_process_pools = {}
+_process_pools_lock = threading.Lock()
+
+
+def get_process_pool(name: str, max_workers: int, max_tasks_per_child: int = None) -> ProcessPoolExecutor:
     """
-    Encodes a media file (image, video, etc.) to Base64 for embedding in HTML.
+    Returns a named process pool shared by every session, creating it on first use.
 
-    Args:
-        media_path (str): Relative path to the media file.
+    Workers are started with "spawn" so they don't inherit Streamlit's server threads. With max_tasks_per_child,
+    each worker is replaced after that many calls, which returns any memory it has built up.
+    """
+    with _process_pools_lock:
+        pool = _process_pools.get(name)
+        if pool is None:
+            # max_tasks_per_child needs Python 3.11, which the app requires
+            pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                       max_tasks_per_child=max_tasks_per_child or None)
+            _process_pools[name] = pool
+            atexit.register(pool.shutdown, wait=False, cancel_futures=True)
+        return pool
+
+
+def _discard_process_pool(name: str, pool: ProcessPoolExecutor, terminate: bool = False):
+    # Drop the pool so the next call starts a fresh one; terminating also stops work that is stuck
+    with _process_pools_lock:
+        if _process_pools.get(name) is pool:
+            del _process_pools[name]
+
+    if terminate:
+        # The executor has no public way to stop a running call, so stop its worker processes directly
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_in_process_pool(name: str, max_workers: int, function, *args, timeout: float = None,
+                        max_tasks_per_child: int = None, terminate_on_timeout: bool = False):
+    """
+    Runs function(*args) in the named process pool and waits for the result.
 
-    Returns:
-        str: Base64-encoded string of the media file.
+    If the pool has broken (e.g. a worker was killed), it is replaced and the call is retried once. When the
+    call takes longer than timeout, TimeoutError is raised; with terminate_on_timeout the pool's workers are
+    also stopped, so a stuck call can't keep holding a worker.
     """
-    # Construct the absolute path to the media file
-    base_path = os.path.dirname(os.path.abspath(__file__))
-    full_path = os.path.join(base_path, media_path)
+    for attempt in range(2):
+        pool = get_process_pool(name, max_workers, max_tasks_per_child)
+        future = pool.submit(function, *args)
+        try:
+            return future.result(timeout=timeout)
+        except BrokenProcessPool:
+            _discard_process_pool(name, pool)
+            if attempt == 1:
+                raise
+        except TimeoutError:
+            if not future.cancel() and terminate_on_timeout:
+                _discard_process_pool(name, pool, terminate=True)
+            raise
 
-    # Check if the file exists
-    if not os.path.exists(full_path):
-        raise FileNotFoundError(f"Media file not found: {full_path}")
 
-    # Encode the file in Base64
-    with open(full_path, "rb") as media_file:
-        return base64.b64encode(media_file.read()).decode()
+_thread_pools = {}
+_thread_pools_lock = threading.Lock()
 
 
-def page_title(title:str, img_path):
-    # Add custom CSS to center the title and change font size
-    st.markdown(
-        """
-        <style>
-        .title {
-          text-align: center;
-          font-size: 100px;  /* Increased font size for the title */
-          font-weight: 550;
-          font-style: normal;
-          margin-bottom: 20px; /* Optional: Add space below the title */
-        }
-        .card {
-            background-color: #f0f2f6;
-            padding: 20px;
-            border-radius: 10px;
-            box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2);
-            text-align: center;
-            max-width: 300px;
-            margin: 0 auto; /* Center the card */
-        }
-        .card-text {
-            font-size: 24px;
-            font-weight: bold;
-            color: #333;
-        }
-        .title-container {
-            display: flex;
-            justify-content: center;
-            align-items: center;  /* Vertically align items in the center */
-        }
-        .title-image {
-        width: 120px;  /* Set the width of the image */
-        height: 120px;  /* Set the height of the image */
-        margin-bottom: 30px; /* Set the margin for soe white space */
-        }
-        </style>
-        """,
-        unsafe_allow_html=True
-        )
+def get_thread_pool(name: str = "stages", max_workers: int = None) -> ThreadPoolExecutor:
+    """
+    Returns a named thread pool shared by every session for I/O-bound work (API calls, database round trips),
+    creating it on first use.
+
+    Work that can wait, like prefetching, gets its own pool so it never queues ahead of work a page is waiting on.
+    Without max_workers the pool gets THREAD_POOL_WORKERS threads (default 8).
+    """
+    with _thread_pools_lock:
+        pool = _thread_pools.get(name)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=max_workers or get_setting("THREAD_POOL_WORKERS", 8, cast=int),
+                                      thread_name_prefix=f"mello_{name}")
+            _thread_pools[name] = pool
+            atexit.register(pool.shutdown, wait=False, cancel_futures=True)
+        return pool
+
+
+def _with_script_run_ctx(function):
+    # Pool threads borrow the session's Streamlit context for the call, so session_state and st.* work in them
+    ctx = get_script_run_ctx()
+
+    def run():
+        thread = threading.current_thread()
+        add_script_run_ctx(thread, ctx)
+        try:
+            return function()
+        finally:
+            add_script_run_ctx(thread, None)
+
+    return run
+
+
+def run_stages(stages: dict, metric: str = "stage") -> dict:
+    """
+    Runs independent stages at the same time on the shared thread pool, each with its own timeout.
+
+    A stage that fails or times out doesn't affect the others; its error is returned instead of raised. A timed
+    out stage keeps running in the background, but its result is discarded.
+
+    Params:
+        stages (dict): Stage name -> (function taking no arguments, timeout in seconds or None).
+        metric (str): Prefix for each stage's recorded timing, e.g. "journal_submit" -> "journal_submit:analyze".
+
+    Returns:
+        dict: Stage name -> {"result": return value or None, "error": exception or None, "duration_ms": float}.
+    """
+    pool = get_thread_pool()
+    started = time.perf_counter()
+    futures = {name: pool.submit(_with_script_run_ctx(function)) for name, (function, _) in stages.items()}
+
+    outcomes = {}
+    for name, future in futures.items():
+        timeout = stages[name][1]
+        remaining = None if timeout is None else max(0.0, timeout - (time.perf_counter() - started))
+
+        result, error = None, None
+        try:
+            result = future.result(timeout=remaining)
+        except TimeoutError:
+            future.cancel()
+            error = TimeoutError(f"{name} took longer than {timeout}s")
+        except Exception as stage_error:
+            error = stage_error
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        record_timing(f"{metric}:{name}", duration_ms, failed=error is not None)
+        outcomes[name] = {"result": result, "error": error, "duration_ms": duration_ms}
+
+    return outcomes
+
+
+def _rollback_quietly(conn):
+    # A dead connection can't roll back; the pool will discard it
+    try:
+        conn.rollback()
+    except Exception:
+        pass
+
+class QueryCache:
+    """
+    Process-wide cache of query_select results shared by every session, with a time-to-live
+    and least-recently-used eviction once max_entries is reached.
+
+    Each entry is tagged with its table and the user(s) it was filtered on, so writes can
+    invalidate exactly the results they affect.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        # key -> (expires_at, table, owner tags, DataFrame), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key):
+        """
+        Returns a copy of the cached DataFrame for key, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+
+            expires_at, _, _, data = entry
+            if time.monotonic() > expires_at:
+                del self._entries[key]
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+
+        # Copy so callers can add columns without changing the cached frame
+        return data.copy()
+
+    def put(self, key, table: str, owners: set, data: pd.DataFrame):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, table, owners, data.copy())
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, table: str, owners: set = None):
+        """
+        Drops cached results for a table, limited to the given owner tags if any are known.
+        """
+        with self._lock:
+            stale = [
+                key for key, (_, entry_table, entry_owners, _) in self._entries.items()
+                if entry_table == table and (not owners or not entry_owners or entry_owners & owners)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.stats["invalidations"] += len(stale)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+            return dict(self.stats, hit_rate=round(hit_rate, 3), entries=len(self._entries),
+                        max_entries=self.max_entries, ttl=self.ttl)
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryCache:
+    """
+    Returns the process-wide query cache, creating it on first use.
+    """
+    global _query_cache
+
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryCache(
+                max_entries=get_setting("QUERY_CACHE_MAX_ENTRIES", 512, cast=int),
+                ttl=get_setting("QUERY_CACHE_TTL", 300, cast=float),
+            )
+
+    return _query_cache
+
+
+def query_cache_stats() -> dict:
+    """
+    Returns query cache counters (hits, misses, evictions, invalidations) and its current size.
+    """
+    return get_query_cache().get_stats()
+
+
+def _owner_tag(column: str, value):
+    # user ids arrive as ints, numpy ints or strings depending on the page
+    column = column.upper()
+    if column == "USER_ID":
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            pass
+    return (column, value)
+
+
+def _invalidate_cached_queries(table_title: str, columns: tuple, rows: list, inserted: bool = True):
+    # Drop cached results for the users whose rows were written, or the whole table if unknown
+    table_title = table_title.upper()
+
+    owners = set()
+    for index, column in enumerate(columns):
+        if column.upper() in ("USER_ID", "USERNAME"):
+            owners.update(_owner_tag(column, row[index]) for row in rows)
+
+    if table_title == "USER_ACCOUNTS":
+        # Accounts are looked up by id and by username, so an update can't be matched to a single tag
+        if not inserted:
+            owners = set()
+    elif not owners and 'user_id' in st.session_state:
+        # Pages only ever change the logged-in user's own rows
+        owners.add(_owner_tag("USER_ID", st.session_state['user_id']))
+
+    get_query_cache().invalidate(table_title, owners)
+
+
+# Columns that query_select may filter and order on, per table
+TABLE_COLUMNS = {
+    "USER_ACCOUNTS": {"USER_ID", "USERNAME", "NAME", "DATA_PERMISSION", "PASSWORD_HASH"},
+    "JOURNAL_ENTRIES": {"USER_ID", "DATE_CREATED", "JOURNAL_ENTRY", "ANGRY", "FEAR", "HAPPY", "SAD", "SURPRISE"},
+    "EVENTS": {"EVENT_ID", "USER_ID", "EVENT_TITLE", "ASSIGNED_DATE", "COMPLETED"},
+}
+
+
+# Compact types for each column, applied to every result so frames don't rely on inferred dtypes
+TABLE_DTYPES = {
+    "USER_ACCOUNTS": {"USER_ID": "int64", "USERNAME": "string", "NAME": "string", "DATA_PERMISSION": "bool",
+                      "PASSWORD_HASH": "string"},
+    "JOURNAL_ENTRIES": {"USER_ID": "int64", "JOURNAL_ENTRY": "string", "ANGRY": "float32", "FEAR": "float32",
+                        "HAPPY": "float32", "SAD": "float32", "SURPRISE": "float32"},
+    "EVENTS": {"EVENT_ID": "int64", "USER_ID": "int64", "EVENT_TITLE": "string", "COMPLETED": "bool"},
+}
+
+# The same types for results kept in Arrow form (dates stay as Arrow dates)
+ARROW_TYPES = {
+    "int64": pa.int64(),
+    "float32": pa.float32(),
+    "bool": pa.bool_(),
+    "string": pa.string(),
+}
+DATE_COLUMNS = {"DATE_CREATED", "ASSIGNED_DATE"}
+
+
+def apply_table_dtypes(table_title: str, data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Casts the columns of a query result to the compact types listed in TABLE_DTYPES.
+
+    Missing booleans (e.g. events never marked) count as False; integer columns with missing
+    values are left as they are.
+    """
+    for column, dtype in TABLE_DTYPES.get(table_title.upper(), {}).items():
+        if column not in data.columns:
+            continue
+        if dtype == "bool":
+            data[column] = data[column].fillna(False).astype(bool)
+        elif dtype == "int64" and data[column].isna().any():
+            continue
+        else:
+            data[column] = data[column].astype(dtype)
+    return data
+
+
+def apply_arrow_types(table_title: str, batch: pa.Table) -> pa.Table:
+    """
+    Casts an Arrow result to the compact types listed in TABLE_DTYPES.
+    """
+    dtypes = TABLE_DTYPES.get(table_title.upper(), {})
+    fields = []
+    for field in batch.schema:
+        if field.name in dtypes:
+            fields.append(pa.field(field.name, ARROW_TYPES[dtypes[field.name]]))
+        elif field.name in DATE_COLUMNS:
+            fields.append(pa.field(field.name, pa.date32()))
+        else:
+            fields.append(field)
+    return batch.cast(pa.schema(fields))
+
+
+FILTER_OPERATORS = ("=", "!=", ">", ">=", "<", "<=")
+
+
+def _checked_column(table_title: str, column: str) -> str:
+    # Column names can't be bound as parameters, so only known columns are allowed into the SQL
+    column = column.strip().upper()
+    if column not in TABLE_COLUMNS.get(table_title, set()):
+        raise ValueError(f"Column '{column}' can't be used to filter or order {table_title}.")
+    return column
+
+
+def _build_select_query(table_title: str, columns: tuple, user_id: int = None, username: str = None,
+                        filters: dict = None, date_column: str = None, start_date=None, end_date=None,
+                        order_by=None, limit: int = None):
+    # Builds the parameterized SELECT used by query_select and query_select_batches.
+    # Returns (table_title, query, params, user_id) with user_id defaulting to the session user.
+    table_title = table_title.upper()
+
+    # Ensure at least one filter criterion is provided
+    if not user_id and not username:
+        try:
+            user_id = int(st.session_state['user_id'])
+        except:
+            raise ValueError("user_id in session state is not defined. Either user_id or username must be provided to filter the query.")
+
+    # Check if columns is provided
+    if columns:
+        # Ensure that columns are treated as a list of strings (even if there's only one column)
+        if isinstance(columns, str):
+            # If columns is a single string, don't join
+            columns_str = columns
+        else:
+            # Join the columns if it's a list of strings
+            columns_str = ", ".join(columns)
+    else:
+        # If no columns, use '*' to select all columns
+        columns_str = "*"
+
+    # Start constructing the query
+    query = 'SELECT ' + columns_str + ' FROM ' + table_title
+
+    # Add the WHERE clause based on the available parameters
+    conditions = []
+    params = []
+    if user_id:
+        conditions.append("USER_ID = %s")
+        params.append(user_id)
+    if username:
+        conditions.append("USERNAME = %s")
+        params.append(username)
+
+    for key, value in (filters or {}).items():
+        # Keys may carry a comparison operator, e.g. {"event_id >": 10}
+        column, _, operator = key.strip().partition(" ")
+        column = _checked_column(table_title, column)
+        operator = operator.strip() or "="
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"Invalid filter operator '{operator}'.")
+
+        if operator != "=":
+            conditions.append(f"{column} {operator} %s")
+            params.append(value)
+        elif value is None:
+            conditions.append(f"{column} IS NULL")
+        elif isinstance(value, (list, tuple, set)):
+            if not value:
+                # Nothing can match an empty IN list
+                conditions.append("1 = 0")
+            else:
+                conditions.append(f"{column} IN ({', '.join(['%s'] * len(value))})")
+                params.extend(value)
+        else:
+            conditions.append(f"{column} = %s")
+            params.append(value)
+
+    if start_date is not None or end_date is not None:
+        if not date_column:
+            raise ValueError("date_column must be provided to filter by start_date or end_date.")
+        date_column = _checked_column(table_title, date_column)
+        if start_date is not None:
+            conditions.append(f"{date_column} >= %s")
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append(f"{date_column} <= %s")
+            params.append(end_date)
+
+    # Join conditions with AND if more than one is provided
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+
+    if order_by:
+        if isinstance(order_by, str):
+            order_by = [order_by]
+        order_terms = []
+        for term in order_by:
+            column, _, direction = term.strip().partition(" ")
+            direction = direction.strip().upper() or "ASC"
+            if direction not in ("ASC", "DESC"):
+                raise ValueError(f"Invalid sort direction '{direction}'.")
+            order_terms.append(f"{_checked_column(table_title, column)} {direction}")
+        query += ' ORDER BY ' + ', '.join(order_terms)
+
+    if limit is not None:
+        query += ' LIMIT %s'
+        params.append(int(limit))
+
+    return table_title, query, params, user_id
+
+
+def _read_dataframe(query: str, params: list, table_title: str, timer: DbCallTimer) -> pd.DataFrame:
+    # Runs a read on a pooled connection and records it on the timer; errors are recorded and re-raised
+    backend = get_storage_backend()
+
+    def run_query(conn):
+        cursor = conn.cursor()
+        try:
+            # Execute the query with parameters
+            with timer.phase("execute"):
+                cursor.execute(backend.prepare(query), params)
+            with timer.phase("fetch"):
+                return apply_table_dtypes(table_title, backend.fetch_dataframe(cursor))
+        finally:
+            cursor.close()
+
+    try:
+        data = run_with_connection(run_query, timer)
+    except Exception as e:
+        timer.finish(error=e)
+        raise
+
+    timer.add_result(len(data), _dataframe_size(data))
+    timer.finish()
+    return data
+
+
+def query_select(table_title: str, columns: tuple, user_id: int = None, username: str = None,
+                 filters: dict = None, date_column: str = None, start_date=None, end_date=None,
+                 order_by=None, limit: int = None, use_cache: bool = True) -> pd.DataFrame:
+    """
+    Extracts data from a Snowflake table based on specific user criteria using the SQL SELECT function.
     
+    Params:
+        table_title (str): Title of Snowflake table to select information from.
+        user_id (int, optional): User ID to filter data.
+        username (str, optional): Username to filter data.
+        columns (str): Column data to extract.
+        filters (dict, optional): Extra column -> value filters. Lists, tuples and sets become IN (...), None becomes IS NULL.
+            A key may end with a comparison operator, e.g. {"event_id >": 10}.
+        date_column (str, optional): Date column that start_date and end_date apply to.
+        start_date (date, optional): Earliest date to include.
+        end_date (date, optional): Latest date to include.
+        order_by (str or list, optional): Column(s) to sort by, each optionally followed by ASC or DESC.
+        limit (int, optional): Maximum number of rows to return.
+        use_cache (bool, optional): Serve repeated queries from the shared query cache.
+        
+    Returns:
+        pd.DataFrame: Data retrieved from the query, or an empty DataFrame if no data is found.
+    """
+    table_title, query, params, user_id = _build_select_query(
+        table_title, columns, user_id=user_id, username=username, filters=filters, date_column=date_column,
+        start_date=start_date, end_date=end_date, order_by=order_by, limit=limit
+    )
+
+    timer = DbCallTimer(query, table_title)
+
+    # Serve repeated queries from the shared cache
+    cache = get_query_cache()
+    cache_key = (query, tuple(params))
+    if use_cache:
+        data = cache.get(cache_key)
+        if data is not None:
+            timer.add_result(len(data), _dataframe_size(data))
+            timer.finish(cached=True)
+            return data
+
+    try:
+        data = _read_dataframe(query, params, table_title, timer)
+    except Exception as e:
+        print(f"Error executing query: {query}", e)
+        return pd.DataFrame()  # Return an empty DataFrame on error
+
+    if use_cache:
+        owners = set()
+        if user_id:
+            owners.add(_owner_tag("USER_ID", user_id))
+        if username:
+            owners.add(_owner_tag("USERNAME", username))
+        cache.put(cache_key, table_title, owners, data)
+
+    return data
+
+def query_select_batches(table_title: str, columns: tuple, as_arrow: bool = False, batch_size: int = 1000, **criteria):
+    """
+    Streams a SELECT result in chunks instead of materializing it all at once.
+
+    Accepts the same filtering, ordering and limit arguments as query_select. Results are not
+    cached, and the pooled connection is held until the generator is exhausted or closed.
+
+    Params:
+        table_title (str): Title of Snowflake table to select information from.
+        columns (tuple): Column data to extract.
+        as_arrow (bool, optional): Yield pyarrow Tables instead of DataFrames.
+        batch_size (int, optional): Rows per chunk (Snowflake picks its own chunk sizes).
+        **criteria: user_id, username, filters, date_column, start_date, end_date, order_by, limit.
+
+    Yields:
+        pd.DataFrame or pa.Table: One chunk of rows with the compact per-table types.
+    """
+    table_title, query, params, _ = _build_select_query(table_title, columns, **criteria)
+
+    backend = get_storage_backend()
+    pool = get_connection_pool()
+    timer = DbCallTimer(query, table_title)
+    with timer.phase("acquire"):
+        conn = pool.acquire()
+    discard = False
+    error = None
+    cursor = None
+
+    try:
+        # Inside the try so a connection that fails here is still released
+        cursor = conn.cursor()
+        with timer.phase("execute"):
+            cursor.execute(backend.prepare(query), params)
+
+        if as_arrow:
+            batches = backend.fetch_arrow_batches(cursor, batch_size)
+        else:
+            batches = backend.fetch_dataframe_batches(cursor, batch_size)
+
+        while True:
+            # Only time the fetch itself, not the caller's work between batches
+            with timer.phase("fetch"):
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                if as_arrow:
+                    batch = apply_arrow_types(table_title, batch)
+                    timer.add_result(batch.num_rows, batch.nbytes)
+                else:
+                    batch = apply_table_dtypes(table_title, batch)
+                    timer.add_result(len(batch), _dataframe_size(batch))
+            yield batch
+    except Exception as e:
+        error = e
+        discard = is_session_expired(e)
+        raise
+    finally:
+        if cursor is not None:
+            cursor.close()
+        pool.release(conn, discard=discard)
+        timer.finish(error=error)
+
+
+def query_select_arrow(table_title: str, columns: tuple, **criteria) -> pa.Table:
+    """
+    Runs a SELECT and keeps the result in Arrow form for aggregation (e.g. with pyarrow.compute).
+
+    Accepts the same arguments as query_select_batches.
+
+    Returns:
+        pa.Table: All rows with the compact per-table types.
+    """
+    batches = list(query_select_batches(table_title, columns, as_arrow=True, **criteria))
+    if not batches:
+        return pa.table({})
+    return pa.concat_tables(batches)
+
+
+def insert_data(table_title: str, columns: tuple, data: tuple, returning: str = None):
+    """
+    Inserts a row of data into snowflake table
+
+    Params:
+        table_title (str): Title of snowflake table to select information from
+        columns (list): List of column titles 
+        data (str): 
+        returning (str, optional): Key column (e.g. USER_ID) whose generated value should be returned
+
+    Returns:
+        The generated key if returning is given and the insert succeeded, otherwise None
+
+    """
+
+    # Validate the length of data matches columns
+    if len(columns) != len(data):
+        raise ValueError("The number of columns and data values must match.")
+
+    # Join column names and create placeholders dynamically
+    columns_str = ', '.join(columns)
+    placeholders = ', '.join(["%s"] * len(columns))  # Create a placeholder for each column
+
+    # Construct the query string
+    insert_query = 'INSERT INTO ' + table_title + '(' + columns_str + ')' + ' VALUES ' + '(' + placeholders + ')'
+
+    if returning:
+        returning = _checked_column(table_title.upper(), returning)
+
+    backend = get_storage_backend()
+    timer = DbCallTimer(insert_query, table_title)
+
+    def run_insert(conn):
+        cursor = conn.cursor()
+        try:
+            with timer.phase("execute"):
+                if returning:
+                    key = backend.execute_insert_returning(cursor, table_title.upper(), columns, insert_query, data, returning)
+                else:
+                    cursor.execute(backend.prepare(insert_query), data)  # Pass data as parameters
+                    key = None
+                conn.commit()
+            timer.add_result(1)
+            return key
+        except Exception:
+            _rollback_quietly(conn)  # Roll back in case of error
+            raise
+        finally:
+            cursor.close()
+
+    # Execute the query on a pooled connection
+    try:
+        key = run_with_connection(run_insert, timer)
+        timer.finish()
+        _invalidate_cached_queries(table_title, columns, [data])
+        _mark_cached_events_stale(table_title)
+        return key
+    except Exception as e:
+        timer.finish(error=e)
+        print(f"Error inserting data ({insert_query}):", e)
+
+def insert_multiple_data(table_title: str, columns: tuple, data: list):
+    """
+    Inserts multiple rows of data into a Snowflake table.
+
+    Params:
+        table_title (str): Title of Snowflake table to insert data into.
+        columns (tuple): Tuple of column names in the table.
+        data (list of tuples): List of tuples where each tuple represents a row to insert.
+
+    Returns:
+        None
+    """
+
+    # Validate that data is a list of tuples
+    if not isinstance(data, list):
+        raise ValueError("Data must be a list of tuples.")
+    
+    if not all(isinstance(row, tuple) for row in data):
+        raise ValueError("Each element in data must be a tuple representing a row.")
+    
+    # Validate that each row of data matches the number of columns
+    if not all(len(columns) == len(row) for row in data):
+        raise ValueError("Each row of data must have the same number of elements as columns.")
+
+    # Join column names and create placeholders dynamically
+    columns_str = ', '.join(columns)
+    placeholders = ', '.join(["%s"] * len(columns))  # Create a placeholder for each column
+
+    # Construct the query string
+    insert_query = 'INSERT INTO ' + table_title + ' (' + columns_str + ')  VALUES (' + placeholders + ')'
+
+    backend = get_storage_backend()
+    timer = DbCallTimer(insert_query, table_title)
+
+    def run_insert(conn):
+        cursor = conn.cursor()
+        try:
+            # Execute the insert for all rows in data
+            with timer.phase("execute"):
+                cursor.executemany(backend.prepare(insert_query), data)  # Use executemany for inserting multiple rows
+                conn.commit()
+            timer.add_result(cursor.rowcount)
+        except Exception:
+            _rollback_quietly(conn)  # Roll back in case of error
+            raise
+        finally:
+            cursor.close()
+
+    # Execute the query on a pooled connection
+    try:
+        run_with_connection(run_insert, timer)
+        timer.finish()
+        _invalidate_cached_queries(table_title, columns, data)
+        _mark_cached_events_stale(table_title)
+    except Exception as e:
+        timer.finish(error=e)
+        print(f"Error inserting data into {table_title}: {e}")
+
+def update_data(table_name: str, column_to_update: str, new_value: bool, condition_column: str, condition_value):
+    """
+    Updates a column value in Snowflake based on a condition.
+
+    Params:
+        table_name (str): Name of the Snowflake table.
+        column_to_update (str): Column to update.
+        new_value (bool): The new value to set (True or False).
+        condition_column (str): The column used to filter the rows.
+        condition_value: The value to match in the condition column.
+
+    Returns:
+        None
+    """
+    # Create the SQL UPDATE query
+    update_query = f"""
+    UPDATE {table_name}
+    SET {column_to_update} = %s
+    WHERE {condition_column} = %s
+    """
+
+    backend = get_storage_backend()
+    timer = DbCallTimer(update_query, table_name)
+
+    def run_update(conn):
+        cursor = conn.cursor()
+        try:
+            # Execute the update query with parameters
+            with timer.phase("execute"):
+                cursor.execute(backend.prepare(update_query), (new_value, condition_value))
+                conn.commit()
+            timer.add_result(cursor.rowcount)
+        except Exception:
+            _rollback_quietly(conn)  # Roll back in case of error
+            raise
+        finally:
+            cursor.close()
+
+    # Execute the query on a pooled connection
+    try:
+        run_with_connection(run_update, timer)
+        timer.finish()
+        _invalidate_cached_queries(table_name, (condition_column,), [(condition_value,)], inserted=False)
+        _patch_cached_events(table_name, column_to_update, condition_column, {condition_value: new_value})
+        print(f"Successfully updated {column_to_update} to {new_value} where {condition_column} = {condition_value}.")
+    except Exception as e:
+        timer.finish(error=e)
+        print(f"Error updating data: {e}")
+
+def bulk_update_data(table_name: str, column_to_update: str, condition_column: str, new_values: dict):
+    """
+    Updates a column for many rows in a single statement and transaction.
+
+    Each row can get its own value, e.g. marking some events completed and others not completed in one call.
+
+    Params:
+        table_name (str): Name of the Snowflake table.
+        column_to_update (str): Column to update.
+        condition_column (str): The column identifying each row (e.g. event_id).
+        new_values (dict): Maps each condition_column value to the new value for that row.
+
+    Returns:
+        None
+
+    Raises:
+        Exception: The database error, after the transaction is rolled back, so the caller can tell the user.
+    """
+    if not new_values:
+        return
+
+    # One CASE branch per row, restricted to the rows being changed
+    case_branches = " ".join(["WHEN %s THEN %s"] * len(new_values))
+    placeholders = ', '.join(["%s"] * len(new_values))
+
+    update_query = f"""
+    UPDATE {table_name}
+    SET {column_to_update} = CASE {condition_column} {case_branches} END
+    WHERE {condition_column} IN ({placeholders})
+    """
+
+    params = []
+    for condition_value, new_value in new_values.items():
+        params.extend([condition_value, new_value])
+    params.extend(new_values.keys())
+
+    backend = get_storage_backend()
+    timer = DbCallTimer(update_query, table_name)
+
+    def run_update(conn):
+        cursor = conn.cursor()
+        try:
+            with timer.phase("execute"):
+                cursor.execute(backend.prepare(update_query), params)
+                conn.commit()
+            timer.add_result(cursor.rowcount)
+        except Exception:
+            _rollback_quietly(conn)  # Roll back in case of error
+            raise
+        finally:
+            cursor.close()
+
+    # Execute the query on a pooled connection
+    try:
+        run_with_connection(run_update, timer)
+        timer.finish()
+        _invalidate_cached_queries(table_name, (condition_column,), [(value,) for value in new_values], inserted=False)
+        _patch_cached_events(table_name, column_to_update, condition_column, new_values)
+        print(f"Successfully updated {column_to_update} for {len(new_values)} rows in {table_name}.")
+    except Exception as e:
+        timer.finish(error=e)
+        print(f"Error updating data: {e}")
+        raise
+
+EVENT_COLUMNS = ("event_id", "event_title", "assigned_date", "completed")
+
+
+def load_events(assigned_date: date = None) -> pd.DataFrame:
+    """
+    Returns the logged-in user's events, using the copy cached in session state when it is loaded.
+
+    A cached frame that has been marked stale is brought up to date with sync_events rather than reloaded.
+
+    Params:
+        assigned_date (date, optional): Only return events for this day. If the full calendar
+            hasn't been loaded this session, only that day's rows are fetched from the database.
+
+    Returns:
+        pd.DataFrame: Events with EVENT_ID, EVENT_TITLE, ASSIGNED_DATE and COMPLETED columns.
+    """
+    if not st.session_state.get('events_loaded') and 'events_high_water_mark' in st.session_state:
+        sync_events()
+
+    if st.session_state.get('events_loaded'):
+        # Retrieve cached events
+        events = st.session_state['events']
+        if assigned_date is None:
+            return events
+        return events[events['ASSIGNED_DATE'] == assigned_date]
+
+    if assigned_date is not None:
+        return query_select("events", columns=EVENT_COLUMNS, filters={"assigned_date": assigned_date})
+
+    events = query_select("events", columns=EVENT_COLUMNS, order_by="event_id")
+
+    # Cache the events and mark as loaded
+    st.session_state['events'] = events
+    st.session_state['events_high_water_mark'] = _max_event_id(events)
+    st.session_state['events_loaded'] = True
+
+    return events
+
+
+def sync_events():
+    """
+    Brings the cached events up to date by fetching only rows added since the last load.
+
+    The high-water mark is the largest EVENT_ID already cached. Changes to existing rows made
+    by this session are patched in place by update_data/bulk_update_data, so they need no re-read.
+    """
+    high_water_mark = st.session_state['events_high_water_mark']
+    new_events = query_select("events", columns=EVENT_COLUMNS, filters={"event_id >": high_water_mark}, order_by="event_id")
+
+    if not new_events.empty:
+        events = st.session_state['events']
+        st.session_state['events'] = new_events if events.empty else pd.concat([events, new_events], ignore_index=True)
+        st.session_state['events_high_water_mark'] = _max_event_id(new_events)
+
+    st.session_state['events_loaded'] = True
+
+
+def _max_event_id(events: pd.DataFrame) -> int:
+    # Event ids start at 1, so 0 means "nothing cached yet"
+    return int(events['EVENT_ID'].max()) if not events.empty else 0
+
+
+def _mark_cached_events_stale(table_title: str):
+    # New events need their generated ids, so the next load_events fetches just the new rows
+    if table_title.upper() == "EVENTS" and 'events_high_water_mark' in st.session_state:
+        st.session_state['events_loaded'] = False
+
+
+def _patch_cached_events(table_name: str, column_to_update: str, condition_column: str, new_values: dict):
+    # Apply a successful update to the cached events frame so it doesn't have to be re-read
+    events = st.session_state.get('events') if table_name.upper() == "EVENTS" else None
+    if events is None or events.empty:
+        return
+
+    column, condition = column_to_update.upper(), condition_column.upper()
+    if column not in events.columns or condition not in events.columns:
+        return
+
+    for condition_value, new_value in new_values.items():
+        events.loc[events[condition] == condition_value, column] = new_value
+
+EMOTIONS = ("Angry", "Fear", "Happy", "Sad", "Surprise")
+
+# Streaks use gaps-and-islands: consecutive days minus their row number share the same island
+DASHBOARD_KPI_QUERY = """
+WITH days AS (
+    SELECT DISTINCT DATE_CREATED AS DAY FROM JOURNAL_ENTRIES WHERE USER_ID = %s
+),
+islands AS (
+    SELECT DAY, {day_number} - ROW_NUMBER() OVER (ORDER BY DAY) AS ISLAND FROM days
+),
+streaks AS (
+    SELECT ISLAND, COUNT(*) AS STREAK, MAX(DAY) AS LAST_DAY FROM islands GROUP BY ISLAND
+),
+latest AS (
+    SELECT AVG(ANGRY) AS ANGRY, AVG(FEAR) AS FEAR, AVG(HAPPY) AS HAPPY, AVG(SAD) AS SAD, AVG(SURPRISE) AS SURPRISE
+    FROM JOURNAL_ENTRIES
+    WHERE USER_ID = %s AND DATE_CREATED = (SELECT MAX(DAY) FROM days)
+)
+SELECT
+    (SELECT COALESCE(MAX(STREAK), 0) FROM streaks) AS BEST_STREAK,
+    (SELECT COALESCE(MAX(STREAK), 0) FROM streaks WHERE LAST_DAY = %s) AS CURRENT_STREAK,
+    (SELECT COUNT(*) FROM days) AS JOURNAL_DAYS,
+    (SELECT MAX(DAY) FROM days) AS LATEST_DAY,
+    (SELECT COUNT(*) FROM EVENTS
+        WHERE USER_ID = %s AND ASSIGNED_DATE = %s AND NOT COALESCE(COMPLETED, FALSE)) AS TODOS_REMAINING,
+    latest.ANGRY, latest.FEAR, latest.HAPPY, latest.SAD, latest.SURPRISE
+FROM latest
+"""
+
+
+def get_dashboard_kpis(user_id: int, today: date) -> dict:
+    """
+    Computes the dashboard's KPIs in a single database query.
+
+    Params:
+        user_id (int): The logged-in user.
+        today (date): The day the current streak and todo count are measured against.
+
+    Returns:
+        dict: best_streak, current_streak, journal_days, todos_remaining, latest_day and
+            latest_emotions (average scores for latest_day, keyed by emotion, or None). Zeros and None if the
+            query fails.
+    """
+    backend = get_storage_backend()
+    query = DASHBOARD_KPI_QUERY.format(day_number=backend.day_number("DAY"))
+    params = [user_id, user_id, today, user_id, today]
+
+    try:
+        row = _read_dataframe(query, params, "JOURNAL_ENTRIES", DbCallTimer(query, "JOURNAL_ENTRIES")).iloc[0]
+    except Exception as e:
+        # Same as query_select: the dashboard shows its placeholders instead of failing
+        print(f"Error executing query: {query}", e)
+        return {"best_streak": 0, "current_streak": 0, "journal_days": 0, "todos_remaining": 0,
+                "latest_day": None, "latest_emotions": None}
+
+    latest_day = row["LATEST_DAY"]
+    latest_emotions = None
+    if latest_day is not None and not pd.isna(latest_day):
+        # SQLite returns computed dates as text
+        latest_day = pd.to_datetime(latest_day).date()
+        latest_emotions = {emotion: round(float(row[emotion.upper()]), 1) for emotion in EMOTIONS}
+    else:
+        latest_day = None
+
+    return {
+        "best_streak": int(row["BEST_STREAK"]),
+        "current_streak": int(row["CURRENT_STREAK"]),
+        "journal_days": int(row["JOURNAL_DAYS"]),
+        "todos_remaining": int(row["TODOS_REMAINING"]),
+        "latest_day": latest_day,
+        "latest_emotions": latest_emotions,
+    }
+
+# def import_html_media(media_path: str):
+#     # Encode the image in base64
+#     with open(media_path, "rb") as img_file:
+#         return base64.b64encode(img_file.read()).decode()
+
+
+class ByteBoundedLRU:
+    """
+    Process-wide LRU cache bounded by the total size of its values rather than their number.
+
+    Values bigger than the whole cache aren't stored, and the least recently used entries are evicted once the
+    total goes over max_bytes. Subclasses can override _value_size when a value isn't a sized string.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+
+        # key -> value, least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _value_size(self, value) -> int:
+        return len(value)
+
+    def get(self, key, is_current=None):
+        """
+        Returns the cached value, or None when there is none or is_current(value) says it is out of date.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None and (is_current is None or is_current(value)):
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return value
+
+            self.stats["reloads" if value is not None else "misses"] += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            old_value = self._entries.pop(key, None)
+            if old_value is not None:
+                self._size -= self._value_size(old_value)
+
+            # Values bigger than the whole cache are recomputed every time
+            size = self._value_size(value)
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = value
+            self._size += size
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self._value_size(evicted)
+                self.stats["evictions"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"] + self.stats.get("reloads", 0)
+            hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+            return dict(self.stats, hit_rate=round(hit_rate, 3), entries=len(self._entries), bytes=self._size,
+                        max_bytes=self.max_bytes)
+
+
+class MediaCache(ByteBoundedLRU):
+    """
+    Process-wide LRU cache of base64-encoded media files.
+
+    Entries are checked against the file's modification time and size on every lookup, so edited
+    assets are picked up, and the cache is bounded by the total size of the encoded strings.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        super().__init__(max_bytes)
+        self.stats["reloads"] = 0
+
+    def _value_size(self, value) -> int:
+        # Entries are (mtime_ns, file size, encoded string)
+        return len(value[2])
+
+    def get(self, full_path: str) -> str:
+        file_stat = os.stat(full_path)
+        version = (file_stat.st_mtime_ns, file_stat.st_size)
+
+        entry = super().get(full_path, is_current=lambda entry: entry[:2] == version)
+        if entry is not None:
+            return entry[2]
+
+        # Encode the file in Base64 outside the lock
+        with open(full_path, "rb") as media_file:
+            encoded = base64.b64encode(media_file.read()).decode()
+
+        self.put(full_path, (*version, encoded))
+        return encoded
+
+
+_media_cache = None
+_media_cache_lock = threading.Lock()
+
+
+def get_media_cache() -> MediaCache:
+    """
+    Returns the process-wide media cache, creating it on first use.
+    """
+    global _media_cache
+
+    with _media_cache_lock:
+        if _media_cache is None:
+            _media_cache = MediaCache(get_setting("MEDIA_CACHE_MAX_BYTES", 16 * 1024 * 1024, cast=int))
+
+    return _media_cache
+
+
+def media_cache_stats() -> dict:
+    """
+    Returns media cache counters (hits, misses, reloads, evictions) and its current size.
+    """
+    return get_media_cache().get_stats()
+
+
+def import_html_media(media_path: str):
+    """
+    Encodes a media file (image, video, etc.) to Base64 for embedding in HTML.
+
+    Encoded files are kept in the shared media cache, so reruns don't re-read them from disk.
+
+    Args:
+        media_path (str): Relative path to the media file.
+
+    Returns:
+        str: Base64-encoded string of the media file.
+    """
+    # Construct the absolute path to the media file
+    base_path = os.path.dirname(os.path.abspath(__file__))
+    full_path = os.path.join(base_path, media_path)
+
+    # Check if the file exists
+    if not os.path.exists(full_path):
+        raise FileNotFoundError(f"Media file not found: {full_path}")
+
+    return get_media_cache().get(full_path)
+
+
+# Written by scripts/build_assets.py: display-sized PNG/GIF and WebP copies of each asset the pages show
+ASSET_MANIFEST_PATH = "assets/optimized/manifest.json"
+ASSET_FORMATS = ("webp", "png", "original")
+
+# (mtime_ns, manifest) of the last manifest read
+_asset_manifest = (None, {})
+_asset_manifest_lock = threading.Lock()
+
+
+def load_asset_manifest() -> dict:
+    """
+    Returns the optimised asset manifest, re-reading it only when the file changes.
+
+    Returns:
+        dict: Manifest entries keyed by source asset path, or an empty dict when no build has been run.
+    """
+    global _asset_manifest
+
+    base_path = os.path.dirname(os.path.abspath(__file__))
+    manifest_path = os.path.join(base_path, ASSET_MANIFEST_PATH)
+
+    try:
+        mtime = os.stat(manifest_path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+
+    with _asset_manifest_lock:
+        if _asset_manifest[0] != mtime:
+            with open(manifest_path, encoding="utf-8") as manifest_file:
+                _asset_manifest = (mtime, json.load(manifest_file))
+        return _asset_manifest[1]
+
+
+def resolve_asset(media_path: str) -> str:
+    """
+    Swaps an asset path for its optimised copy from the manifest, in the format set by ASSET_FORMAT.
+
+    ASSET_FORMAT is "webp" (default), "png" (PNG, or GIF for animations) or "original". The original path is
+    returned when the asset isn't in the manifest or has changed since the build.
+
+    Params:
+        media_path (str): Relative path to the source asset, e.g. mimicon_path("happy").
+
+    Returns:
+        str: Relative path of the file to serve.
+    """
+    asset_format = str(get_setting("ASSET_FORMAT", "webp")).lower()
+    if asset_format not in ASSET_FORMATS or asset_format == "original":
+        return media_path
+
+    entry = load_asset_manifest().get(media_path)
+    if entry is None:
+        return media_path
+
+    base_path = os.path.dirname(os.path.abspath(__file__))
+
+    # An edited source asset is served as-is until the build is re-run
+    try:
+        if os.path.getsize(os.path.join(base_path, media_path)) != entry["source_bytes"]:
+            return media_path
+    except FileNotFoundError:
+        return media_path
+
+    formats = entry["formats"]
+    optimized_path = formats.get(asset_format) or formats.get("gif")
+    if optimized_path is None or not os.path.exists(os.path.join(base_path, optimized_path)):
+        return media_path
+
+    return optimized_path
+
+
+# Published assets are copied here, which Streamlit serves at app/static/ when server.enableStaticServing is on
+STATIC_DIR = "static"
+STATIC_URL_PREFIX = "app/static"
+
+# full path -> (mtime_ns, file size, url) of assets already copied into the static folder
+_static_urls = {}
+_static_urls_lock = threading.Lock()
+
+
+def static_asset_url(media_path: str) -> str:
+    """
+    Publishes a media file into the static folder under a content-hashed name and returns its URL.
+
+    The name changes whenever the file's contents do, so browsers and proxies can cache the URL forever.
+
+    Params:
+        media_path (str): Relative path to the media file, e.g. "assets/fire-icon.png".
+
+    Returns:
+        str: URL of the file, e.g. "app/static/assets/fire-icon.3f2a9c1d04be.png".
+    """
+    base_path = os.path.dirname(os.path.abspath(__file__))
+    full_path = os.path.join(base_path, media_path)
+
+    if not os.path.exists(full_path):
+        raise FileNotFoundError(f"Media file not found: {full_path}")
+
+    file_stat = os.stat(full_path)
+    version = (file_stat.st_mtime_ns, file_stat.st_size)
+
+    with _static_urls_lock:
+        entry = _static_urls.get(full_path)
+        if entry is not None and entry[:2] == version:
+            return entry[2]
+
+    with open(full_path, "rb") as media_file:
+        content = media_file.read()
+    digest = hashlib.sha256(content).hexdigest()[:12]
+
+    # Keep the asset's folder layout and only swap in the hashed file name
+    relative_path = os.path.relpath(full_path, base_path).replace(os.sep, "/")
+    folder, file_name = os.path.split(relative_path)
+    stem, extension = os.path.splitext(file_name)
+    static_name = f"{stem}.{digest}{extension}"
+
+    static_folder = os.path.join(base_path, STATIC_DIR, folder)
+    static_path = os.path.join(static_folder, static_name)
+    if not os.path.exists(static_path):
+        os.makedirs(static_folder, exist_ok=True)
+
+        # Write to a temporary name first so a half-written file is never served
+        temp_path = f"{static_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as static_file:
+            static_file.write(content)
+        os.replace(temp_path, static_path)
+
+    url = "/".join(part for part in (STATIC_URL_PREFIX, folder, quote(static_name)) if part)
+
+    with _static_urls_lock:
+        _static_urls[full_path] = (*version, url)
+
+    return url
+
+
+def media_mode() -> str:
+    """
+    Returns how media is embedded in HTML: "static" (URLs served by Streamlit) or "inline" (base64 data URIs).
+
+    Static mode needs server.enableStaticServing, so it falls back to inline when that is off.
+    """
+    mode = str(get_setting("MEDIA_MODE", "static")).lower()
+    if mode == "static" and not st.get_option("server.enableStaticServing"):
+        return "inline"
+    return mode
+
+
+def media_src(media_path: str) -> str:
+    """
+    Returns a value for an HTML src attribute that points at a media file, using its optimised copy if built.
+
+    Params:
+        media_path (str): Relative path to the media file.
+
+    Returns:
+        str: A static file URL in static mode, otherwise a base64 data URI.
+    """
+    media_path = resolve_asset(media_path)
+
+    if media_mode() == "static":
+        try:
+            return static_asset_url(media_path)
+        except OSError as error:
+            # A read-only app folder can't hold published assets, so embed the file instead
+            if isinstance(error, FileNotFoundError):
+                raise
+            print(f"Could not publish {media_path} as a static file, embedding it instead: {error}")
+
+    mime_type = mimetypes.guess_type(media_path)[0] or "application/octet-stream"
+    return f"data:{mime_type};base64,{import_html_media(media_path)}"
+
+
+# Every style the pages use, see inject_styles()
+STYLESHEET_PATH = "assets/css/mello.css"
+
+# (mtime_ns, minified css) of the last stylesheet read
+_stylesheet = (None, "")
+_stylesheet_lock = threading.Lock()
+
+
+def load_stylesheet() -> str:
+    """
+    Returns the app's stylesheet with comments and extra whitespace stripped, re-reading it only when it changes.
+    """
+    global _stylesheet
+
+    base_path = os.path.dirname(os.path.abspath(__file__))
+    stylesheet_path = os.path.join(base_path, STYLESHEET_PATH)
+    mtime = os.stat(stylesheet_path).st_mtime_ns
+
+    with _stylesheet_lock:
+        if _stylesheet[0] != mtime:
+            with open(stylesheet_path, encoding="utf-8") as stylesheet_file:
+                css = stylesheet_file.read()
+            css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+            css = re.sub(r"\s*([{};:,])\s*", r"\1", css)
+            css = re.sub(r"\s+", " ", css).strip()
+            _stylesheet = (mtime, css)
+        return _stylesheet[1]
+
+
+def inject_styles():
+    """
+    Adds the shared stylesheet to the page.
+
+    Called once at the top of every render in streamlit_app.py; the helpers below only emit markup that relies on it.
+    """
+    st.markdown(f"<style>{load_stylesheet()}</style>", unsafe_allow_html=True)
+
+
+def page_title(title:str, img_path):
     # Get title image
-    # Encode the image in base64
-    title_image = import_html_media(img_path)
+    title_image = media_src(img_path)
     
-    # Embed the HTML structure with the image in base64
+    # Embed the HTML structure with the image
     st.markdown(
         f"""
         <div class="title-container">
-            <img class="title-image" style = "margin-right: 50px" src = "data:image/png;base64,{title_image}">
-            <h1 class="dm-serif-display"style="font-size: 100px; font-weight: 600">{title}</h1>
-            <img class="title-image" style = "margin-left: 10px" src="data:image/png;base64,{title_image}">
+            <img class="title-image" style = "margin-right: 50px" src = "{title_image}">
+            <h1 class="dm-serif-display" style="font-size: 100px; font-weight: 600">{title}</h1>
+            <img class="title-image" style = "margin-left: 10px" src="{title_image}">
+        </div>
+        """,
+        unsafe_allow_html=True
+    )
+
+def _bcrypt_hash(password: bytes, rounds: int) -> bytes:
+    # Runs in a worker process
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+def _bcrypt_check(password: bytes, stored_hash: bytes) -> bool:
+    # Runs in a worker process
+    return bcrypt.checkpw(password, stored_hash)
+
+def bcrypt_rounds() -> int:
+    # Work factor for new hashes; raising it makes existing hashes get upgraded on login
+    return get_setting("BCRYPT_ROUNDS", 12, cast=int)
+
+def _run_bcrypt(function, *args):
+    # Hash in a worker process so logins don't hold the GIL other sessions' reruns need
+    return run_in_process_pool("bcrypt", get_setting("BCRYPT_WORKERS", 2, cast=int), function, *args)
+
+def hash_password(password):
+    started = time.perf_counter()
+    rounds = bcrypt_rounds()
+    password_hashed = _run_bcrypt(_bcrypt_hash, password.encode(), rounds).decode()
+    record_timing("bcrypt_hash", (time.perf_counter() - started) * 1000, rounds=rounds)
+    return password_hashed
+
+def verify_password(entered_password, stored_hash_password):
+    started = time.perf_counter()
+    is_correct = _run_bcrypt(_bcrypt_check, entered_password.encode(), stored_hash_password.encode())
+    record_timing("bcrypt_verify", (time.perf_counter() - started) * 1000, rounds=password_hash_rounds(stored_hash_password))
+    return is_correct
+
+def password_hash_rounds(stored_hash_password: str) -> int:
+    # bcrypt hashes look like $2b$12$<salt and hash>, where 12 is the work factor
+    return int(stored_hash_password.split("$")[2])
+
+def password_needs_rehash(stored_hash_password: str) -> bool:
+    """
+    Checks whether a stored hash was made with a different work factor than the one configured.
+    """
+    return password_hash_rounds(stored_hash_password) != bcrypt_rounds()
+
+def kpi_card(img_path, top_emotion: str, percent_value):
+    
+    # Static URL or data URI for the icon
+    icon_src = media_src(img_path)
+
+    # Card markup, styled by the shared stylesheet
+    st.markdown(
+        f"""
+        <!-- Flexbox container wrapping the card -->
+        <div class="flex-container">
+            <div class="card">
+                <img src="{icon_src}">
+                <div>
+                    <div class="subtitle">{top_emotion}</div>
+                    <div class="percentage">{percent_value}</div>
+                </div>
+            </div>
         </div>
         """,
         unsafe_allow_html=True
     )
 
-def hash_password(password):
-    password_hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-    return password_hashed
+def html_graph(image_base64, title=""):
+    """
+    Generates HTML content for displaying an image in Streamlit.
+
+    Args:
+    image_base64 (str): Base64 encoded PNG of the plot, or a ready-made src (URL or data URI).
+    title (str): Title of the HTML container.
+    
+    Returns:
+    None
+    """
+    # Plots rendered on the fly arrive as raw base64, static assets arrive as URLs
+    if image_base64.startswith(("data:", "http://", "https://", STATIC_URL_PREFIX)):
+        image_src = image_base64
+    else:
+        image_src = f"data:image/png;base64,{image_base64}"
+
+    html_content = f"""
+    <div class="graph-container">
+        <div class="graph-card">
+            <img src="{image_src}" alt="{title}"/>
+        </div>
+    </div>
+    """
+    st.markdown(html_content, unsafe_allow_html=True)
+
+# Styling of each dashboard chart; part of the chart cache key, so changing a value here re-renders the chart
+CHART_STYLES = {
+    "emotion_bar": {
+        "figsize": (10, 2),
+        "palette": ["#7D7DDA", "#8C8CDA", "#9A9AD9", "#A9A9D9", "#B7B7D8"],
+        "title": "Today's Emotions",
+        "ylabel": "Percentage (%)",
+    },
+    "emotion_timeline": {
+        "figsize": (10, 2),
+        "palette": ["#cdb4db", "#ffc8dd", "#ffafcc", "#bde0fe", "#a2d2ff"],
+        "title": "Emotion Percentages Over Time",
+        "ylabel": "Percentage (%)",
+        "linewidth": 10,
+        "date_format": "%d-%m-%Y",
+    },
+}
+
+
+def _draw_emotion_bar(emotions_data: pd.DataFrame, style: dict):
+    # emotions_data has one row per emotion with its Emotion name and Count percentage
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+
+    sns.set(style="whitegrid")
+    fig, ax = plt.subplots(figsize=style["figsize"])
+
+    # Custom color palette for emotions
+    purple_palette = sns.color_palette(style["palette"])
+
+    # Bar plot for emotions
+    sns.barplot(x="Emotion", y="Count", data=emotions_data, palette=purple_palette, ax=ax)
+
+    # Add labels
+    ax.set_title(style["title"], fontsize=16)
+    ax.set_xlabel("")
+    ax.set_ylabel(style["ylabel"], fontsize=12)
+
+    return fig
+
+
+def _draw_emotion_timeline(entries_grouped: pd.DataFrame, style: dict):
+    # entries_grouped has one row per DATE with the average score of each emotion column
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+
+    emotion_columns = [column for column in entries_grouped.columns if column != 'DATE']
+
+    # Melt the DataFrame to use seaborn lineplot for time series
+    entries_melted = entries_grouped.melt(id_vars=['DATE'], value_vars=emotion_columns,
+                                          var_name="EMOTION", value_name="PERCENTAGE")
+    # Rename EMOTION values in entries_melted to capitalize the first letter
+    entries_melted['EMOTION'] = entries_melted['EMOTION'].str.capitalize()
+
+    sns.set(style="whitegrid")
+    line_color = sns.color_palette(style["palette"])
+
+    fig, ax = plt.subplots(figsize=style["figsize"])
+
+    # Line plot for emotions over time
+    sns.lineplot(data=entries_melted, x="DATE", y="PERCENTAGE", hue="EMOTION", marker='o', ax=ax, palette=line_color,
+                 linewidth=style["linewidth"])
+
+    # Add labels and title
+    ax.set_title(style["title"], fontsize=16)
+    ax.set_ylabel(style["ylabel"], fontsize=12)
+    ax.set_xlabel("")
+
+    ax.legend(loc="center left", bbox_to_anchor=(1, 0.5), title="Emotions")
+
+    ax.set_xticks(entries_grouped['DATE'])  # Set ticks explicitly to match the string dates
+    ax.set_xticklabels([d.strftime(style["date_format"]) for d in entries_grouped['DATE']])
+
+    # Rotate x-axis labels for better readability
+    plt.setp(ax.get_xticklabels(), rotation=45)
+
+    return fig
+
+
+CHART_DRAWERS = {
+    "emotion_bar": _draw_emotion_bar,
+    "emotion_timeline": _draw_emotion_timeline,
+}
+
+
+class ChartCache(ByteBoundedLRU):
+    """
+    Process-wide LRU cache of rendered charts, keyed by a hash of the plotted data and the chart's style.
+
+    Charts are bounded by the total size of their encoded images, so the cache holds a fixed amount of memory no
+    matter how many users visit the dashboard.
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024):
+        super().__init__(max_bytes)
+
+
+_chart_cache = None
+_chart_cache_lock = threading.Lock()
+
+
+def get_chart_cache() -> ChartCache:
+    """
+    Returns the process-wide chart cache, creating it on first use.
+    """
+    global _chart_cache
+
+    with _chart_cache_lock:
+        if _chart_cache is None:
+            _chart_cache = ChartCache(get_setting("CHART_CACHE_MAX_BYTES", 8 * 1024 * 1024, cast=int))
+
+    return _chart_cache
+
+
+def chart_cache_stats() -> dict:
+    """
+    Returns chart cache counters (hits, misses, evictions) and its current size.
+    """
+    return get_chart_cache().get_stats()
+
+
+def _chart_key(chart: str, data: pd.DataFrame, style: dict) -> str:
+    # Same chart, style and data (values, column names and order) means the same image
+    digest = hashlib.sha256(chart.encode())
+    digest.update(json.dumps(style, sort_keys=True).encode())
+    digest.update(json.dumps([str(column) for column in data.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def _render_chart_image(chart: str, data: pd.DataFrame, style: dict, image_format: str) -> dict:
+    """
+    Draws a chart and saves it as image bytes, always closing the figure. Runs in a chart worker process.
+
+    Returns:
+        dict: The image bytes plus the worker's pid, peak memory and number of figures still open.
+    """
+    import matplotlib.pyplot as plt
+
+    # Worker processes never show windows, so skip any interactive backend
+    if plt.get_backend().lower() != "agg":
+        plt.switch_backend("Agg")
+
+    fig = None
+    try:
+        fig = CHART_DRAWERS[chart](data, style)
+
+        # Save the plot to a BytesIO buffer
+        buf = io.BytesIO()
+        fig.savefig(buf, format=image_format, bbox_inches="tight")
+        image = buf.getvalue()
+        buf.close()
+    finally:
+        # pyplot keeps every figure until it is closed, which would grow the worker on each render
+        if fig is not None:
+            plt.close(fig)
+
+    # ru_maxrss is in kilobytes on Linux; resource is unavailable on Windows
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+
+    return {"image": image, "pid": os.getpid(), "peak_rss_mb": peak_rss_mb, "open_figures": len(plt.get_fignums())}
+
+
+# Chart worker health, shown in the debug panel
+CHART_WORKER_MEMORY_HISTORY = 16
+_chart_render_stats = {"renders": 0, "timeouts": 0, "failures": 0, "open_figures": 0, "worker_peak_rss_mb": {}}
+_chart_render_stats_lock = threading.Lock()
+
+
+def chart_render_stats() -> dict:
+    """
+    Returns chart render counts (renders, timeouts, failures), figures left open and each worker's peak memory.
+    """
+    with _chart_render_stats_lock:
+        return dict(_chart_render_stats, worker_peak_rss_mb=dict(_chart_render_stats["worker_peak_rss_mb"]))
+
+
+def render_chart_image(chart: str, data: pd.DataFrame, image_format: str = "png") -> bytes:
+    """
+    Renders a dashboard chart to image bytes in the chart worker pool.
+
+    Drawing holds the GIL for hundreds of milliseconds, so it runs in separate processes (CHART_WORKERS, default 2;
+    0 renders in this process). Each worker is replaced after CHART_MAX_TASKS_PER_CHILD renders and a render
+    taking longer than CHART_RENDER_TIMEOUT seconds is stopped.
+
+    Params:
+        chart (str): Name of the chart in CHART_STYLES, e.g. "emotion_bar".
+        data (pd.DataFrame): Data to plot, in the shape the chart's drawer expects.
+        image_format (str): "png" or "svg".
 
-def verify_password(entered_password, stored_hash_password):
-    is_correct = bcrypt.checkpw(entered_password.encode(), stored_hash_password.encode())
-    return is_correct
+    Returns:
+        bytes: The rendered image.
 
-def kpi_card(img_path, top_emotion: str, percent_value):
-    
-    # Encoding image as base64 (for demonstration purpose)
-    encoded_icon = import_html_media(img_path)
+    Raises:
+        TimeoutError: If the render takes longer than CHART_RENDER_TIMEOUT seconds.
+    """
+    style = CHART_STYLES[chart]
+    workers = get_setting("CHART_WORKERS", 2, cast=int)
 
-    # Inject custom CSS for Google Fonts
-    st.markdown(
-        """
-        <style>
-            /* Import DM Serif Display and Pacifico from Google Fonts */
-            @import url('https://fonts.googleapis.com/css2?family=DM+Serif+Display:ital@0;1&family=Pacifico&display=swap');
+    started = time.perf_counter()
+    try:
+        if workers > 0:
+            result = run_in_process_pool("charts", workers, _render_chart_image, chart, data, style, image_format,
+                                         timeout=get_setting("CHART_RENDER_TIMEOUT", 20, cast=float),
+                                         max_tasks_per_child=get_setting("CHART_MAX_TASKS_PER_CHILD", 50, cast=int),
+                                         terminate_on_timeout=True)
+        else:
+            result = _render_chart_image(chart, data, style, image_format)
+    except TimeoutError:
+        with _chart_render_stats_lock:
+            _chart_render_stats["timeouts"] += 1
+        raise
+    except Exception:
+        with _chart_render_stats_lock:
+            _chart_render_stats["failures"] += 1
+        raise
+
+    with _chart_render_stats_lock:
+        _chart_render_stats["renders"] += 1
+        _chart_render_stats["open_figures"] = result["open_figures"]
+        if result["peak_rss_mb"] is not None:
+            worker_memory = _chart_render_stats["worker_peak_rss_mb"]
+            worker_memory[result["pid"]] = round(result["peak_rss_mb"], 1)
+
+            # Recycled workers get new pids, so only the most recent ones are kept
+            while len(worker_memory) > CHART_WORKER_MEMORY_HISTORY:
+                del worker_memory[next(iter(worker_memory))]
+
+    record_timing("chart_render", (time.perf_counter() - started) * 1000, chart=chart, format=image_format,
+                  bytes=len(result["image"]), worker_peak_rss_mb=result["peak_rss_mb"])
+    return result["image"]
+
+
+def render_chart(chart: str, data: pd.DataFrame):
+    """
+    Renders a dashboard chart to a Base64-encoded PNG, reusing the cached image when the data hasn't changed.
 
-            /* Apply font classes */
-            .dm-serif-display {
-                font-family: 'DM Serif Display', serif;
-            }
+    Params:
+        chart (str): Name of the chart in CHART_STYLES, e.g. "emotion_bar".
+        data (pd.DataFrame): Data to plot, in the shape the chart's drawer expects.
 
-            .pacifico {
-                font-family: 'Pacifico', cursive;
-            }
+    Returns:
+        str: Base64-encoded PNG for html_graph(), or None if the chart couldn't be rendered in time.
+    """
+    style = CHART_STYLES[chart]
+    key = _chart_key(chart, data, style)
 
-            /* Center text styling for demonstration */
-            .center-text {
-                text-align: center;
-            }
-        </style>
-        """,
-        unsafe_allow_html=True
-    )
+    cache = get_chart_cache()
+    encoded = cache.get(key)
+    if encoded is not None:
+        return encoded
 
-    # HTML and CSS content to render in Streamlit
-    st.markdown(
-        f"""
-        <style>
-        /* Flexbox container to center content */
-        .flex-container {{
-            display: flex;
-            justify-content: center; /* Center horizontally */
-            align-items: center; /* Center vertically */
-            width: 100%;
-            height: auto; /* Adjust height if needed */
-        }}
-
-        .card {{
-            cursor: pointer;
-            width: 380px;
-            height: 150px;
-            background: rgb(255, 255, 255);
-            border-radius: 15px;
-            border: 2px solid rgba(0, 0, 255, .2);
-            transition: all .2s;
-            box-shadow: 12px 12px 2px 1px rgba(0, 0, 255, .2);
-            display: flex;
-            align-items: center; /* Align vertically */
-            justify-content: flex-start; /* Align items to the left */
-            padding: 10px;
-            text-align: left;
-            font-family: Arial, sans-serif;
-            color: rgb(50, 50, 50);
-            margin: 20px;
-        }}
-
-        .card:hover {{
-            box-shadow: -12px 12px 2px -1px rgba(0, 0, 255, .2);
-        }}
-
-        .card img {{
-            width: 100px;
-            height: 100px;
-            object-fit: contain;
-            margin-right: 20px;
-            margin-left: 20px;
-        }}
-
-        .card .subtitle {{
-            font-size: 20px;
-            font-family: 'DM Serif Display', serif;
-            font-weight: 600;
-            margin-top: 7px;
-        }}
-
-        .card .emotion {{
-            font-size: 30px;
-            font-family: 'Pacifico', cursive;
-            margin-bottom: -5px;
-        }}
-
-        .card .percentage {{
-            font-size: 50px;
-            font-family: 'DM Serif Display', serif;
-            font-weight: 600;
-        }}
-        </style>
+    try:
+        image = render_chart_image(chart, data)
+    except TimeoutError:
+        print(f"Rendering the {chart} chart timed out")
+        return None
 
-        <!-- Flexbox container wrapping the card -->
-        <div class="flex-container">
-            <div class="card">
-                <img src="data:image/png;base64,{encoded_icon}">
-                <div>
-                    <div class="subtitle">{top_emotion}</div>
-                    <div class="percentage">{percent_value}</div>
-                </div>
-            </div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+    # Encode the image to base64
+    encoded = base64.b64encode(image).decode("utf-8")
 
-def html_graph(image_base64, title=""):
+    cache.put(key, encoded)
+    return encoded
+
+
+def _vega_title(style: dict) -> dict:
+    return {"text": style["title"], "fontSize": 16}
+
+
+def chart_spec(chart: str, data: pd.DataFrame) -> dict:
     """
-    Generates HTML content for displaying an image in Streamlit.
+    Builds a Vega-Lite spec for a dashboard chart, with the same palette and labels as the rendered image.
+
+    The browser draws the chart, so the spec only carries the data points.
+
+    Params:
+        chart (str): Name of the chart in CHART_STYLES, e.g. "emotion_bar".
+        data (pd.DataFrame): Data to plot, in the same shape render_chart() takes.
 
-    Args:
-    image_base64 (str): Base64 encoded image of the plot.
-    title (str): Title of the HTML container.
-    
     Returns:
-    None
+        dict: Vega-Lite spec with the data inlined.
     """
-    html_content = f"""
-    <div style="
-        display: flex;
-        flex-direction: column;
-        justify-content: center;
-        align-items: center;
-        height: 60vh;
-        background: transparent;">
-        <div style="
-            border: 2px solid rgba(0, 0, 255, .2);
-            border-radius: 15px;
-            padding: 20px;
-            text-align: center;
-            background-color: #ffffff;
-            width: 85%;
-            box-shadow: 12px 12px 2px 1px rgba(0, 0, 255, .2);
-            margin-bottom: 40px;">
-            <img src="data:image/png;base64,{image_base64}" alt="{title}" style="width: 100%; border-radius: 10px;"/>
-        </div>
-    </div>
+    style = CHART_STYLES[chart]
+    height = style["figsize"][1] * 100
+
+    if chart == "emotion_bar":
+        return {
+            "data": {"values": data[["Emotion", "Count"]].to_dict("records")},
+            "title": _vega_title(style),
+            "height": height,
+            "mark": "bar",
+            "encoding": {
+                "x": {"field": "Emotion", "type": "nominal", "sort": None, "title": None, "axis": {"labelAngle": 0}},
+                "y": {"field": "Count", "type": "quantitative", "title": style["ylabel"]},
+                "color": {"field": "Emotion", "type": "nominal", "sort": None, "legend": None,
+                          "scale": {"range": style["palette"]}},
+            },
+        }
+
+    if chart == "emotion_timeline":
+        emotion_columns = [column for column in data.columns if column != 'DATE']
+        points = data.melt(id_vars=['DATE'], value_vars=emotion_columns, var_name="EMOTION", value_name="PERCENTAGE")
+        points['EMOTION'] = points['EMOTION'].str.capitalize()
+        points['DATE'] = points['DATE'].dt.strftime("%Y-%m-%d")
+
+        return {
+            "data": {"values": points.to_dict("records")},
+            "title": _vega_title(style),
+            "height": height,
+            "mark": {"type": "line", "point": True, "strokeWidth": style["linewidth"]},
+            "encoding": {
+                "x": {"field": "DATE", "type": "temporal", "timeUnit": "yearmonthdate", "title": None,
+                      "axis": {"format": style["date_format"], "labelAngle": -45}},
+                "y": {"field": "PERCENTAGE", "type": "quantitative", "title": style["ylabel"]},
+                "color": {"field": "EMOTION", "type": "nominal", "title": "Emotions",
+                          "scale": {"range": style["palette"]}},
+            },
+        }
+
+    raise ValueError(f"No Vega-Lite spec for chart: {chart}")
+
+
+def show_chart(chart: str, data: pd.DataFrame):
     """
-    st.markdown(html_content, unsafe_allow_html=True)
+    Shows a dashboard chart, either as a server-rendered image or as a Vega-Lite spec drawn by the browser.
+
+    CHART_MODE picks "image" (default) or "vega".
+    """
+    mode = str(get_setting("CHART_MODE", "image")).lower()
+
+    if mode == "vega":
+        started = time.perf_counter()
+        spec = chart_spec(chart, data)
+        record_timing("chart_spec", (time.perf_counter() - started) * 1000, chart=chart)
+        st.vega_lite_chart(spec, width="stretch", theme=None)
+        return
+
+    encoded = render_chart(chart, data)
+    if encoded:
+        html_graph(encoded)
+    else:
+        st.warning("This chart is taking too long to draw, please refresh the page.")
+
 
 def mimicon_path(state:str):
     return f"assets/mimi-icons/{state.lower()}-mimi.png"
@@ -518,28 +2544,384 @@ def extract_json_to_python(response_content):
         raise ValueError("Invalid JSON format.") from e
         
 
-def analyze_emotions(journal_entry):
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an assistant that analyzes journal entries. Respond strictly with a JSON object containing percentages for the emotions Angry, Fear, Happy, Sad, Surprise. Ensure the percentages sum to 100%. Do not include any additional text."
-            },
-            {
-                "role": "user",
-                "content": f"Journal Entry: {journal_entry}"
-            }
-        ]
-        
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            max_tokens=150,
-            temperature=0
-        )
-        
-        raw_content = response['choices'][0]['message']['content']
-        print("Raw Response:", raw_content)  # Debugging step
-        return extract_json(raw_content)
+# Bump EMOTION_PROMPT_VERSION whenever the prompt changes, so results from the old prompt are no longer reused
+EMOTION_MODEL = "gpt-4o-mini"
+EMOTION_PROMPT_VERSION = 1
+EMOTION_SYSTEM_PROMPT = "You are an assistant that analyzes journal entries. Respond strictly with a JSON object containing percentages for the emotions Angry, Fear, Happy, Sad, Surprise. Ensure the percentages sum to 100%. Do not include any additional text."
+
+
+class EmotionCache:
+    """
+    Persistent cache of analyze_emotions results in a local SQLite file.
+
+    Entries are keyed by a hash of the user, the normalized journal text, the model and the prompt version, so a
+    user resubmitting the same text reuses their earlier result and nothing is shared between users. Once there
+    are more than max_entries, the least recently used are deleted.
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+
+        self._conn = None
+        self._lock = threading.Lock()
+
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened on first use; every session shares it under the lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS EMOTION_CACHE (
+                    CACHE_KEY TEXT PRIMARY KEY,
+                    USER_ID TEXT NOT NULL,
+                    SCORES TEXT NOT NULL,
+                    CREATED_AT REAL NOT NULL,
+                    LAST_USED REAL NOT NULL,
+                    HITS INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS EMOTION_CACHE_LAST_USED ON EMOTION_CACHE (LAST_USED)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def make_key(user_id, journal_entry: str, model: str, prompt_version: int) -> str:
+        # Whitespace and Unicode composition differences don't change the analysis
+        normalized = " ".join(unicodedata.normalize("NFC", journal_entry).split())
+        payload = json.dumps([str(user_id), model, prompt_version, normalized])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT SCORES FROM EMOTION_CACHE WHERE CACHE_KEY = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+
+            conn.execute("UPDATE EMOTION_CACHE SET LAST_USED = ?, HITS = HITS + 1 WHERE CACHE_KEY = ?",
+                         (time.time(), key))
+            conn.commit()
+            self.stats["hits"] += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, user_id, scores: dict):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO EMOTION_CACHE (CACHE_KEY, USER_ID, SCORES, CREATED_AT, LAST_USED) "
+                         "VALUES (?, ?, ?, ?, ?)", (key, str(user_id), json.dumps(scores), now, now))
+            self.stats["stores"] += 1
+
+            overflow = conn.execute("SELECT COUNT(*) FROM EMOTION_CACHE").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute("DELETE FROM EMOTION_CACHE WHERE CACHE_KEY IN "
+                             "(SELECT CACHE_KEY FROM EMOTION_CACHE ORDER BY LAST_USED LIMIT ?)", (overflow,))
+                self.stats["evictions"] += overflow
+            conn.commit()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            entries, total_hits = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(HITS), 0) FROM EMOTION_CACHE").fetchone()
+            lookups = self.stats["hits"] + self.stats["misses"]
+            hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+            return dict(self.stats, hit_rate=round(hit_rate, 3), entries=entries, lifetime_hits=total_hits,
+                        max_entries=self.max_entries)
+
+
+_emotion_cache = None
+_emotion_cache_lock = threading.Lock()
+
+
+def get_emotion_cache() -> EmotionCache:
+    """
+    Returns the emotion analysis cache, creating it on first use.
+    """
+    global _emotion_cache
+
+    with _emotion_cache_lock:
+        if _emotion_cache is None:
+            _emotion_cache = EmotionCache(get_setting("EMOTION_CACHE_PATH", "mello_emotion_cache.sqlite3"),
+                                          get_setting("EMOTION_CACHE_MAX_ENTRIES", 5000, cast=int))
+
+    return _emotion_cache
+
+
+def emotion_cache_stats() -> dict:
+    """
+    Returns emotion cache counters (hits, misses, stores, evictions), its hit rate and size.
+    """
+    return get_emotion_cache().get_stats()
+
+
+EMOTION_LEXICON_PATH = "assets/emotion_lexicon.json"
+EMOTION_SCORERS = ("llm", "lexicon", "fallback", "shadow")
+
+
+class LexiconScorer:
+    """
+    Scores journal text for each emotion from a weighted word list, locally and in well under a millisecond.
+
+    Each known word (or the word with a common suffix removed) adds its weight per emotion, scaled by an
+    intensifier right before it ("very") and remapped when a negation is among the few words before it ("not happy"
+    counts toward Sad). The totals plus a small prior per emotion become percentages, so text with no known words
+    scores evenly.
+    """
+
+    _TOKEN = re.compile(r"[a-z']+")
+
+    # Remembered word lookups, including misses; cleared when it grows past this many
+    MAX_LOOKUPS = 50000
+
+    def __init__(self, lexicon: dict):
+        self.emotions = tuple(lexicon["emotions"])
+        self.weights = np.array(list(lexicon["weights"].values()), dtype=np.float64)
+        self.negation_weights = np.array(lexicon["negation_weights"], dtype=np.float64)
+        self.negations = frozenset(lexicon["negations"])
+        self.negation_window = lexicon["negation_window"]
+        self.intensifiers = lexicon["intensifiers"]
+        self.suffixes = tuple(lexicon["suffixes"])
+        self.prior = lexicon["prior"]
+
+        self._index = {word: row for row, word in enumerate(lexicon["weights"])}
+        self._lookups = {}
+
+    @classmethod
+    def from_file(cls, path: str) -> "LexiconScorer":
+        with open(path, "r", encoding="utf-8") as lexicon_file:
+            return cls(json.load(lexicon_file))
+
+    def _row(self, token: str) -> int:
+        # Row of the token's weights, or -1 when neither it nor its stem is in the lexicon
+        row = self._lookups.get(token)
+        if row is not None:
+            return row
+
+        row = self._index.get(token, -1)
+        for suffix in self.suffixes:
+            if row >= 0:
+                break
+            if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+                row = self._index.get(token[:-len(suffix)], -1)
+
+        if len(self._lookups) >= self.MAX_LOOKUPS:
+            self._lookups.clear()
+        self._lookups[token] = row
+        return row
+
+    def score_many(self, texts: list) -> np.ndarray:
+        """
+        Scores several texts at once.
+
+        Params:
+            texts (list): Journal texts.
+
+        Returns:
+            np.ndarray: One row per text with the percentage for each emotion, in the order of self.emotions.
+        """
+        documents, rows, scales, negated = [], [], [], []
+        for document, text in enumerate(texts):
+            last_negation = -self.negation_window - 1
+            scale = 1.0
+            for position, token in enumerate(self._TOKEN.findall(text.lower())):
+                if token in self.negations:
+                    last_negation = position
+                    continue
+                if token in self.intensifiers:
+                    scale = self.intensifiers[token]
+                    continue
+
+                row = self._row(token)
+                if row >= 0:
+                    documents.append(document)
+                    rows.append(row)
+                    scales.append(scale)
+                    negated.append(position - last_negation <= self.negation_window)
+                scale = 1.0
+
+        contributions = self.weights[np.array(rows, dtype=np.intp)] * np.array(scales)[:, None]
+        negated = np.array(negated, dtype=bool)
+        contributions[negated] = contributions[negated] @ self.negation_weights
+
+        totals = np.full((len(texts), len(self.emotions)), self.prior, dtype=np.float64)
+        np.add.at(totals, np.array(documents, dtype=np.intp), contributions)
+        return totals / totals.sum(axis=1, keepdims=True) * 100
+
+    def score(self, text: str) -> dict:
+        """
+        Returns whole percentages per emotion that sum to 100, e.g. {"Angry": 10, "Fear": 5, ...}.
+        """
+        percentages = self.score_many([text])[0]
+
+        # Round down, then hand the remaining points to the largest remainders
+        whole = np.floor(percentages).astype(int)
+        for column in np.argsort(whole - percentages)[:100 - whole.sum()]:
+            whole[column] += 1
+
+        return {emotion: int(value) for emotion, value in zip(self.emotions, whole)}
+
+
+_lexicon_scorer = None
+_lexicon_scorer_lock = threading.Lock()
+
+
+def get_lexicon_scorer() -> LexiconScorer:
+    """
+    Returns the lexicon emotion scorer, loading EMOTION_LEXICON_PATH on first use.
+    """
+    global _lexicon_scorer
+
+    with _lexicon_scorer_lock:
+        if _lexicon_scorer is None:
+            base_path = os.path.dirname(os.path.abspath(__file__))
+            _lexicon_scorer = LexiconScorer.from_file(os.path.join(base_path, EMOTION_LEXICON_PATH))
+
+    return _lexicon_scorer
+
+
+# Which scorer answered, and in shadow mode how closely the lexicon agreed with the model; shown in the debug panel
+_emotion_scorer_stats = {"llm": 0, "lexicon": 0, "fallbacks": 0, "shadow_compared": 0, "shadow_same_top": 0,
+                         "shadow_abs_diff_total": 0.0}
+_emotion_scorer_stats_lock = threading.Lock()
+
+
+def emotion_scorer_stats() -> dict:
+    """
+    Returns how often each emotion scorer answered, how often the lexicon stood in for the model and, in shadow
+    mode, how often both picked the same top emotion and their average difference in percentage points.
+    """
+    with _emotion_scorer_stats_lock:
+        stats = dict(_emotion_scorer_stats)
+
+    compared = stats["shadow_compared"]
+    return {"llm": stats["llm"], "lexicon": stats["lexicon"], "fallbacks": stats["fallbacks"],
+            "shadow_compared": compared,
+            "shadow_top_agreement": stats["shadow_same_top"] / compared if compared else None,
+            "shadow_mean_abs_diff": stats["shadow_abs_diff_total"] / (compared * len(EMOTIONS)) if compared else None}
+
+
+def _count_emotion_scorer(key: str, amount=1):
+    with _emotion_scorer_stats_lock:
+        _emotion_scorer_stats[key] += amount
+
+
+def _compare_with_lexicon(journal_entry: str, llm_scores: dict):
+    # Shadow mode: score with the lexicon too and record how far it is from the model
+    started = time.perf_counter()
+    lexicon_scores = get_lexicon_scorer().score(journal_entry)
+    abs_diff = sum(abs(float(llm_scores.get(emotion, 0)) - lexicon_scores[emotion]) for emotion in EMOTIONS)
+    same_top = max(EMOTIONS, key=lambda emotion: float(llm_scores.get(emotion, 0))) == \
+        max(EMOTIONS, key=lexicon_scores.get)
+
+    with _emotion_scorer_stats_lock:
+        _emotion_scorer_stats["shadow_compared"] += 1
+        _emotion_scorer_stats["shadow_same_top"] += int(same_top)
+        _emotion_scorer_stats["shadow_abs_diff_total"] += abs_diff
+    record_timing("analyze_emotions_shadow", (time.perf_counter() - started) * 1000, same_top=same_top,
+                  abs_diff=abs_diff)
+
+
+def _complete_emotions(scores: dict) -> bool:
+    return all(isinstance(scores.get(emotion), (int, float)) for emotion in EMOTIONS)
+
+
+def _llm_emotions(journal_entry, timeout=None):
+    # Asks the model for the emotion percentages
+    messages = [
+        {
+            "role": "system",
+            "content": EMOTION_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": f"Journal Entry: {journal_entry}"
+        }
+    ]
+
+    import openai
+
+    response = openai.ChatCompletion.create(
+        model=EMOTION_MODEL,
+        messages=messages,
+        max_tokens=150,
+        temperature=0,
+        request_timeout=timeout
+    )
+
+    raw_content = response['choices'][0]['message']['content']
+    print("Raw Response:", raw_content)  # Debugging step
+    return extract_json(raw_content)
+
+
+def analyze_emotions(journal_entry, user_id=None):
+        """
+        Scores a journal entry for each emotion in EMOTIONS, reusing the saved result when this user has already
+        submitted the same text.
+
+        The EMOTION_SCORER setting picks how: "llm" (default) asks the model, "lexicon" uses the local LexiconScorer
+        only, "fallback" asks the model but uses the lexicon when the call fails or takes longer than
+        EMOTION_LLM_TIMEOUT seconds (default 10), and "shadow" asks the model and also scores with the lexicon to
+        record how well they agree. Lexicon scores aren't cached since they are cheaper to recompute.
+
+        Params:
+            journal_entry (str): The journal text.
+            user_id: The user who wrote it; cached results are only reused for the same user.
+
+        Returns:
+            dict: Percentage per emotion, e.g. {"Angry": 10, "Fear": 5, ...}.
+        """
+        scorer = str(get_setting("EMOTION_SCORER", "llm")).lower()
+        if scorer not in EMOTION_SCORERS:
+            scorer = "llm"
+
+        started = time.perf_counter()
+        if scorer == "lexicon":
+            scores = get_lexicon_scorer().score(journal_entry)
+            record_timing("analyze_emotions", (time.perf_counter() - started) * 1000, cached=False, scorer="lexicon")
+            _count_emotion_scorer("lexicon")
+            return scores
+
+        cache = get_emotion_cache()
+        key = cache.make_key(user_id, journal_entry, EMOTION_MODEL, EMOTION_PROMPT_VERSION)
+
+        scores = cache.get(key)
+        if scores is not None:
+            record_timing("analyze_emotions", (time.perf_counter() - started) * 1000, cached=True, scorer="llm")
+            return scores
+
+        try:
+            timeout = get_setting("EMOTION_LLM_TIMEOUT", 10, cast=float) if scorer == "fallback" else None
+            scores = _llm_emotions(journal_entry, timeout)
+            if scorer == "fallback" and not _complete_emotions(scores):
+                raise ValueError("Incomplete emotion scores")
+        except Exception:
+            if scorer != "fallback":
+                raise
+            # The model is down, slow or answered with something unreadable
+            scores = get_lexicon_scorer().score(journal_entry)
+            record_timing("analyze_emotions", (time.perf_counter() - started) * 1000, cached=False, scorer="lexicon")
+            _count_emotion_scorer("fallbacks")
+            return scores
+
+        record_timing("analyze_emotions", (time.perf_counter() - started) * 1000, cached=False, scorer="llm")
+        _count_emotion_scorer("llm")
+
+        # Only complete answers are kept, so a malformed one is retried next time
+        complete = _complete_emotions(scores)
+        if complete:
+            cache.put(key, user_id, scores)
+
+        if scorer == "shadow" and complete:
+            # The comparison is only for the debug panel, so it never affects the result
+            try:
+                _compare_with_lexicon(journal_entry, scores)
+            except Exception as e:
+                print(f"Error comparing emotion scores with the lexicon: {e}")
+
+        return scores
 
 
 # def meow():
@@ -549,8 +2931,160 @@ def analyze_emotions(journal_entry):
 #         st.audio(audio_file.read(), format="audio/mp3") 
 
 
-# Function to send the prompt and get a CBT-specific response
-def get_completion(prompt, model="gpt-4o-mini", temperature=0.7):
+MIMI_SYSTEM_PROMPT = """
+            You are a therapist specialized in Cognitive Behavioral Therapy (CBT). 
+            Your goal is to help the user manage negative thoughts and emotions by 
+            applying CBT principles. Offer supportive, thoughtful responses and help the user 
+            reframe unhelpful thoughts.
+        """
+
+# Tokens the API adds around each message for its role and separators
+MESSAGE_TOKEN_OVERHEAD = 4
+
+_token_encodings = {}
+_token_encodings_lock = threading.Lock()
+
+
+def _token_encoding(model: str):
+    # tiktoken is optional; without it (or when its encoding files can't be fetched) token counts are estimated
+    with _token_encodings_lock:
+        if model not in _token_encodings:
+            try:
+                import tiktoken
+                try:
+                    _token_encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _token_encodings[model] = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                _token_encodings[model] = None
+
+        return _token_encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """
+    Counts the tokens in text for the given model, using tiktoken when it is installed and roughly four characters
+    per token otherwise.
+    """
+    encoding = _token_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def _message_tokens(message: dict, model: str) -> int:
+    return count_tokens(message["content"], model) + MESSAGE_TOKEN_OVERHEAD
+
+
+def _first_sentence(text: str) -> str:
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    return sentence if len(sentence) <= 200 else sentence[:200].rstrip() + "…"
+
+
+# Prompt sizes sent to the model, shown in the debug panel
+_chat_context_stats = {"calls": 0, "prompt_tokens": 0, "last_prompt_tokens": 0, "max_prompt_tokens": 0,
+                       "turns_dropped": 0, "turns_summarized": 0, "duplicates_removed": 0}
+_chat_context_stats_lock = threading.Lock()
+
+
+def chat_context_stats() -> dict:
+    """
+    Returns prompt token counts (total, last, largest and average per call) and how many old turns were dropped,
+    summarized or removed as duplicates.
+    """
+    with _chat_context_stats_lock:
+        stats = dict(_chat_context_stats)
+    stats["average_prompt_tokens"] = stats["prompt_tokens"] / stats["calls"] if stats["calls"] else 0.0
+    return stats
+
+
+def build_chat_context(prompt: str, chat_history: list, model: str = "gpt-4o-mini") -> tuple:
+    """
+    Builds the messages for a Mimi completion within a token budget: the system prompt, the most recent turns of
+    the conversation that fit and the new prompt.
+
+    The prompt is sent once, even when it is already the last turn of chat_history, and repeated back-to-back
+    turns are sent once. The whole request is kept within CHAT_CONTEXT_TOKENS (default 3000): when the conversation
+    doesn't fit, CHAT_SUMMARY_TOKENS of it (default 300) go to a note with the first sentence of each older turn,
+    newest first, and turns that don't fit in the note either are dropped.
+
+    Params:
+        prompt (str): The new user message.
+        chat_history (list): (role, message) pairs of the conversation so far, oldest first.
+        model (str): The model the messages are for, used to count tokens.
+
+    Returns:
+        tuple: The list of messages and their token count.
+    """
+    budget = get_setting("CHAT_CONTEXT_TOKENS", 3000, cast=int)
+    summary_budget = get_setting("CHAT_SUMMARY_TOKENS", 300, cast=int)
+
+    system_message = {"role": "system", "content": MIMI_SYSTEM_PROMPT}
+    prompt_message = {"role": "user", "content": prompt}
+    prompt_tokens = _message_tokens(system_message, model) + _message_tokens(prompt_message, model)
+
+    # The page adds the user's question to the history before asking for a reply
+    turns = list(chat_history)
+    duplicates = 0
+    if turns and turns[-1] == ('user', prompt):
+        turns.pop()
+        duplicates += 1
+
+    history = []
+    for role, message in turns:
+        entry = {"role": 'assistant' if role == 'Mimi' else 'user', "content": message}
+        if history and history[-1] == entry:
+            duplicates += 1
+            continue
+        history.append(entry)
+
+    # Keep the newest turns that fit in the budget, leaving room for the note when they don't all fit
+    history_tokens = [_message_tokens(message, model) for message in history]
+    if prompt_tokens + sum(history_tokens) > budget:
+        budget -= summary_budget
+
+    kept = []
+    for message, tokens in zip(reversed(history), reversed(history_tokens)):
+        if prompt_tokens + tokens > budget:
+            break
+        kept.append(message)
+        prompt_tokens += tokens
+    kept.reverse()
+    older = history[:len(history) - len(kept)]
+
+    # Condense the turns that didn't fit, newest first, into one note
+    summary_lines = []
+    summary_tokens = 0
+    for message in reversed(older):
+        speaker = "Mimi" if message["role"] == 'assistant' else "User"
+        line = f"- {speaker}: {_first_sentence(message['content'])}"
+        tokens = count_tokens(line, model) + 1
+        if summary_tokens + tokens > summary_budget - MESSAGE_TOKEN_OVERHEAD - 8:
+            break
+        summary_lines.append(line)
+        summary_tokens += tokens
+
+    messages = [system_message]
+    if summary_lines:
+        summary = {"role": "system",
+                   "content": "Earlier in this conversation:\n" + "\n".join(reversed(summary_lines))}
+        messages.append(summary)
+        prompt_tokens += _message_tokens(summary, model)
+    messages += kept + [prompt_message]
+
+    with _chat_context_stats_lock:
+        _chat_context_stats["calls"] += 1
+        _chat_context_stats["prompt_tokens"] += prompt_tokens
+        _chat_context_stats["last_prompt_tokens"] = prompt_tokens
+        _chat_context_stats["max_prompt_tokens"] = max(_chat_context_stats["max_prompt_tokens"], prompt_tokens)
+        _chat_context_stats["turns_summarized"] += len(summary_lines)
+        _chat_context_stats["turns_dropped"] += len(older) - len(summary_lines)
+        _chat_context_stats["duplicates_removed"] += duplicates
+
+    return messages, prompt_tokens
+
+
+def get_completion(prompt, model="gpt-4o-mini", temperature=0.7, chat_history=None):
     """
     Sends a prompt to the specified language model and returns the model's CBT-based response.
     
@@ -558,39 +3092,195 @@ def get_completion(prompt, model="gpt-4o-mini", temperature=0.7):
     - prompt (str): The input prompt containing the user's statement or question.
     - model (str): The model to be used for generating the completion.
     - temperature (float): Controls the randomness of the output.
+    - chat_history (list): (role, message) pairs to send as context; defaults to the session's chat history.
     
     Returns:
     - str: The content of the response generated by the model, based on CBT principles.
     """
-    messages = [
-        {"role": "system", "content": """
-            You are a therapist specialized in Cognitive Behavioral Therapy (CBT). 
-            Your goal is to help the user manage negative thoughts and emotions by 
-            applying CBT principles. Offer supportive, thoughtful responses and help the user 
-            reframe unhelpful thoughts.
-        """},
-        {"role": "user", "content": prompt}
-    ]
-
-    for role, message in st.session_state['chat_history']:
-        api_role = 'assistant' if role == 'Mimi' else 'user'
-        messages.append({"role": api_role, "content": message})
+    if chat_history is None:
+        chat_history = st.session_state['chat_history']
+    messages, prompt_tokens = build_chat_context(prompt, chat_history, model)
 
-
-    # Add the latest user input
-    messages.append({'role' : 'user' , 'content' : prompt})
+    import openai
 
     # Sends a request to the OpenAI API with the specified parameters
+    started = time.perf_counter()
     response = openai.ChatCompletion.create(
         model=model,
         messages=messages,
         temperature=temperature
     )
+    usage = response.get("usage") or {}
+    record_timing("completion", (time.perf_counter() - started) * 1000, model=model, streamed=False,
+                  prompt_tokens=usage.get("prompt_tokens", prompt_tokens))
 
     # Returns the content of the response generated by the model
     return response.choices[0].message['content']
 
 
+def stream_completion(prompt, model="gpt-4o-mini", temperature=0.7, chat_history=None):
+    """
+    Streaming version of get_completion: yields the response in pieces as the model produces them.
+
+    Time to the first piece is recorded as the "completion_first_token" timing and the whole response as
+    "completion".
+
+    Parameters:
+    - Same as get_completion.
+
+    Yields:
+    - str: The next piece of the response text.
+    """
+    if chat_history is None:
+        chat_history = st.session_state['chat_history']
+    messages, prompt_tokens = build_chat_context(prompt, chat_history, model)
+
+    import openai
+
+    started = time.perf_counter()
+    first_token_ms = None
+    response = openai.ChatCompletion.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        stream=True
+    )
+
+    for chunk in response:
+        content = chunk['choices'][0]['delta'].get('content')
+        if not content:
+            continue
+
+        if first_token_ms is None:
+            first_token_ms = (time.perf_counter() - started) * 1000
+            record_timing("completion_first_token", first_token_ms, model=model)
+        yield content
+
+    record_timing("completion", (time.perf_counter() - started) * 1000, model=model, streamed=True,
+                  first_token_ms=first_token_ms, prompt_tokens=prompt_tokens)
+
+
+def chat_bubble(role: str, message: str) -> str:
+    """
+    Returns the HTML for one chat message: the user's on the right, Mimi's on the left.
+    """
+    if role == 'Mimi':
+        return f"""
+            <div class="chat-bubble mimi">
+                <span class="chat-icon">🐱</span> <b>Mimi:</b> {message}
+            </div>
+            """
+    return f"""
+            <div class="chat-bubble user">
+                <span class="chat-icon">💬</span> <b>You:</b> {message}
+            </div>
+            """
+
+
+# Minimum seconds between redraws of a streaming reply, so fast streams don't send a message per token
+STREAM_REDRAW_INTERVAL = 0.05
+
+
+def stream_chat_reply(chunks):
+    """
+    Shows Mimi's reply in a chat bubble that fills in as the pieces arrive.
+
+    Params:
+        chunks: Iterable of text pieces, e.g. from stream_completion().
+
+    Returns:
+        tuple: The full reply and the placeholder holding its bubble.
+    """
+    placeholder = st.empty()
+    reply = ""
+    last_redraw = 0.0
+
+    for chunk in chunks:
+        reply += chunk
+        if time.monotonic() - last_redraw >= STREAM_REDRAW_INTERVAL:
+            placeholder.markdown(chat_bubble('Mimi', reply + "▌"), unsafe_allow_html=True)
+            last_redraw = time.monotonic()
+
+    placeholder.markdown(chat_bubble('Mimi', reply), unsafe_allow_html=True)
+    return reply, placeholder
+
+
+def journal_reply_prompt(journal_text: str) -> str:
+    # The prompt for Mimi's first reply to the day's journal entry
+    return f"Based on the user's journal entry today:\n\n'{journal_text}'\n\nAct as a therapist and provide supportive adivce and guidance using CBT techniques."
+
+
+def _journal_key(journal_text: str) -> str:
+    return hashlib.sha256(journal_text.encode("utf-8")).hexdigest()
+
+
+# How prefetched journal replies were used, shown in the debug panel
+_journal_reply_stats = {"prefetched": 0, "used": 0, "not_ready": 0, "failed": 0, "stale": 0}
+_journal_reply_stats_lock = threading.Lock()
+
+
+def _count_journal_reply(outcome: str):
+    with _journal_reply_stats_lock:
+        _journal_reply_stats[outcome] += 1
+
+
+def journal_reply_stats() -> dict:
+    """
+    Returns how many journal replies were prefetched and how many were used, not ready yet, failed or stale.
+    """
+    with _journal_reply_stats_lock:
+        return dict(_journal_reply_stats)
+
+
+def prefetch_journal_reply(journal_text: str, model: str = "gpt-4o-mini", temperature: float = 0.7):
+    """
+    Starts generating Mimi's first reply to a journal entry in the background, so the Mimi page can show it as soon
+    as it opens instead of waiting on the model.
+
+    The request runs on its own small thread pool (JOURNAL_REPLY_PREFETCH_WORKERS, default 2), so slow replies
+    never hold up the journal submit stages. It uses a copy of the chat history taken now, so the reply is based on
+    the conversation as it was at submit time. It replaces any earlier prefetch for this session.
+
+    Params:
+        journal_text (str): The submitted journal entry.
+        model (str): The model to generate the reply with.
+        temperature (float): Controls the randomness of the reply.
+    """
+    chat_history = list(st.session_state.get('chat_history', []))
+    pool = get_thread_pool("journal_reply", get_setting("JOURNAL_REPLY_PREFETCH_WORKERS", 2, cast=int))
+    future = pool.submit(get_completion, journal_reply_prompt(journal_text), model, temperature, chat_history)
+
+    st.session_state['journal_reply_prefetch'] = {"key": _journal_key(journal_text), "future": future}
+    _count_journal_reply("prefetched")
+
+
+def take_prefetched_journal_reply(journal_text: str):
+    """
+    Returns the prefetched reply to this journal entry if it has finished, otherwise None (nothing prefetched for
+    this entry, still running or failed). Either way the prefetch is used up.
+    """
+    prefetch = st.session_state.pop('journal_reply_prefetch', None)
+    if prefetch is None:
+        return None
+
+    if prefetch["key"] != _journal_key(journal_text):
+        _count_journal_reply("stale")
+        return None
+
+    future = prefetch["future"]
+    if not future.done():
+        # Left to finish on its own; the page streams a fresh reply rather than waiting without feedback
+        _count_journal_reply("not_ready")
+        return None
+
+    if future.exception() is not None:
+        _count_journal_reply("failed")
+        return None
+
+    _count_journal_reply("used")
+    return future.result()
+
+
 
 
 def generate_suggested_events(chat_history):
@@ -615,6 +3305,8 @@ def generate_suggested_events(chat_history):
     ]
     """
 
+    import openai
+
     response = openai.ChatCompletion.create(
         model = "gpt-4o-mini",
             messages=[
@@ -631,6 +3323,9 @@ def generate_suggested_events(chat_history):
 
 # Function to fetch the quote
 def fetch_quote():
+    import requests
+    from bs4 import BeautifulSoup
+
     url = 'https://www.louisehay.com/affirmations/'
     page = requests.get(url)
 
@@ -646,6 +3341,45 @@ def fetch_quote():
     return quote
 
 
+def show_debug_panel():
+    """
+    Shows database timings, pool and cache stats with export buttons.
+
+    Hidden unless the DEBUG_PANEL setting is enabled and the page is opened with ?debug=1.
+    """
+    if str(get_setting("DEBUG_PANEL", "false")).lower() not in ("1", "true", "yes"):
+        return
+    if st.query_params.get("debug") != "1":
+        return
+
+    with st.expander("Debug: performance"):
+        summary = db_call_summary()
+
+        st.write("Connection pool", connection_pool_stats())
+        st.write("Query cache", query_cache_stats())
+        st.write("Media cache", media_cache_stats())
+        st.write("Chart cache", chart_cache_stats())
+        st.write("Chart workers", chart_render_stats())
+        st.write("Emotion cache", emotion_cache_stats())
+        st.write("Emotion scorer", emotion_scorer_stats())
+        st.write("Journal reply prefetch", journal_reply_stats())
+        st.write("Chat context", chat_context_stats())
+
+        timings = timing_summary()
+        if not timings.empty:
+            st.write("Other timings")
+            st.dataframe(timings)
+
+        if summary.empty:
+            st.write("No database calls recorded yet.")
+        else:
+            st.dataframe(summary)
+            st.download_button("Export summary (CSV)", summary.to_csv(index=False), file_name="db_call_summary.csv",
+                               mime="text/csv")
+            st.download_button("Export call log (JSON)", db_call_log().to_json(orient="records"),
+                               file_name="db_call_log.json", mime="application/json")
+
+
 def show_username_in_corner():
     """
     Displays the logged-in user's username in the top-right corner of the app.
@@ -655,24 +3389,6 @@ def show_username_in_corner():
         # Display username using custom HTML and CSS
         st.markdown(
             f"""
-            <style>
-                .username-display {{
-                    top: 5px;
-                    left: 5px;
-                    background-color: #ab9ee2;
-                    padding: 8px 20px;
-                    border-radius: 10px;
-                    box-shadow: 0px 4px 8px rgba(0, 0, 0, 0.1);
-                    font-size: 20px;
-                    font-weight: bold;
-                    color: #272665;
-                    z-index: 1000;
-                    min-width: 150px; /* Ensures the box has a minimum width */
-                    height: auto; /* Adjust height automatically based on content */
-                    display: inline-block; /* Automatically adjust width based on content */
-                    white-space: nowrap; /* Prevents text from wrapping to the next line */
-                }}
-            </style>
             <div class="username-display">
                 Logged in as: {username}
             </div>
@@ -682,6 +3398,7 @@ def show_username_in_corner():
 
 
 def transcribe_audio(audio_data):
+    import requests
 
     api_key = st.secrets['API_KEY']
     headers = {
@@ -0,0 +1,65 @@
+"""
+Compares the two dashboard chart modes: server-rendered PNGs (CHART_MODE="image") and Vega-Lite specs drawn by the
+browser (CHART_MODE="vega").
+
+For each chart it reports the server time to produce it and the bytes sent to the browser: the Base64 image inside
+html_graph's markup, or the JSON spec with its data points.
+
+    python scripts/bench_chart_modes.py [--days 30] [--repeat 5]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mello_functions as mf
+
+
+def sample_data(days: int) -> dict:
+    # Same shapes the dashboard passes to show_chart()
+    rng = np.random.default_rng(0)
+    emotions_data = pd.DataFrame({"Emotion": ["Angry", "Fear", "Happy", "Sad", "Surprise"],
+                                  "Count": rng.uniform(0, 100, 5).round(1)})
+    entries_grouped = pd.DataFrame({"DATE": pd.date_range(end=pd.Timestamp.today().normalize(), periods=days)})
+    for column in ("ANGRY", "FEAR", "HAPPY", "SAD", "SURPRISE"):
+        entries_grouped[column] = rng.uniform(0, 100, days).round(1)
+    return {"emotion_bar": emotions_data, "emotion_timeline": entries_grouped}
+
+
+def median_ms(function, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings)), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, default=30, help="days of journal history in the timeline")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (median is reported)")
+    args = parser.parse_args()
+
+    print(f"{'chart':<18} {'mode':<6} {'server ms':>10} {'payload bytes':>14}")
+    for chart, data in sample_data(args.days).items():
+        # Rendered in this process, without the chart cache, to time the drawing itself
+        image_ms, image = median_ms(lambda: mf._render_chart_image(chart, data, mf.CHART_STYLES[chart], "png"),
+                                    args.repeat)
+        image_payload = len(base64.b64encode(image["image"]))
+
+        spec_ms, spec = median_ms(lambda: mf.chart_spec(chart, data), args.repeat)
+        spec_payload = len(json.dumps(spec, separators=(",", ":")))
+
+        print(f"{chart:<18} {'image':<6} {image_ms:>10.1f} {image_payload:>14,}")
+        print(f"{chart:<18} {'vega':<6} {spec_ms:>10.1f} {spec_payload:>14,}")
+
+
+if __name__ == "__main__":
+    main()
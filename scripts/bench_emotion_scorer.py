@@ -0,0 +1,89 @@
+"""
+Measures the throughput of the local lexicon emotion scorer (EMOTION_SCORER = "lexicon", "fallback" or "shadow")
+on a corpus of synthetic journal entries, without any network access.
+
+Each entry is built around one emotion, so the report also shows how often the scorer's top emotion matches it.
+The cue sentences are hand-written, so that is a sanity check rather than an accuracy estimate; shadow mode
+measures agreement with the model on real entries.
+
+    python scripts/bench_emotion_scorer.py [--entries 10000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mello_functions as mf
+
+# Sentences that point at one emotion, and neutral filler around them
+CUES = {
+    "Angry": ["My manager yelled at me in front of everyone and I am still furious.",
+              "I got so annoyed when my roommate ignored me again.",
+              "It felt really unfair and I snapped at my brother."],
+    "Fear": ["I am anxious about the interview tomorrow.",
+             "I couldn't sleep because I was worried about money.",
+             "Everything feels overwhelming and I'm scared I'll fail the exam."],
+    "Happy": ["We laughed all evening and I felt so grateful for my friends.",
+              "I finished the project and I'm really proud of myself.",
+              "The walk in the sun made me feel calm and happy."],
+    "Sad": ["I miss my grandmother and cried a lot tonight.",
+            "I felt lonely and exhausted after work.",
+            "I'm not happy with how things are going, everything feels empty."],
+    "Surprise": ["I was shocked when my old friend suddenly called.",
+                 "Totally unexpected news at work today, I'm still stunned.",
+                 "Wow, I did not see that twist coming."],
+}
+FILLER = ["I woke up at seven and made coffee.", "Work was busy as usual.", "I had pasta for dinner.",
+          "The bus was late again.", "I spent some time reading before bed.", "I called my mum in the evening."]
+
+
+def synthetic_entries(count: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    emotions = list(CUES)
+    entries, labels = [], []
+    for _ in range(count):
+        emotion = emotions[rng.integers(len(emotions))]
+        sentences = list(rng.choice(FILLER, size=rng.integers(1, 5), replace=False))
+        sentences.insert(rng.integers(len(sentences) + 1), CUES[emotion][rng.integers(len(CUES[emotion]))])
+        entries.append(" ".join(sentences))
+        labels.append(emotion)
+    return entries, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=10000, help="synthetic journal entries to score")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (median is reported)")
+    args = parser.parse_args()
+
+    entries, labels = synthetic_entries(args.entries)
+    scorer = mf.get_lexicon_scorer()
+
+    batch_timings, single_timings = [], []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        percentages = scorer.score_many(entries)
+        batch_timings.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for entry in entries:
+            scorer.score(entry)
+        single_timings.append(time.perf_counter() - started)
+
+    batch_seconds = float(np.median(batch_timings))
+    single_seconds = float(np.median(single_timings))
+    top = [scorer.emotions[column] for column in percentages.argmax(axis=1)]
+    accuracy = np.mean([predicted == label for predicted, label in zip(top, labels)])
+
+    print(f"entries: {len(entries):,}  average words: {np.mean([len(entry.split()) for entry in entries]):.0f}")
+    print(f"{'mode':<22} {'entries/s':>12} {'us/entry':>10}")
+    print(f"{'score_many (batch)':<22} {len(entries) / batch_seconds:>12,.0f} {batch_seconds / len(entries) * 1e6:>10.1f}")
+    print(f"{'score (one at a time)':<22} {len(entries) / single_seconds:>12,.0f} {single_seconds / len(entries) * 1e6:>10.1f}")
+    print(f"top emotion matches the entry's cue: {accuracy:.1%}")
+
+
+if __name__ == "__main__":
+    main()
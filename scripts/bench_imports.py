@@ -0,0 +1,86 @@
+"""
+Measures cold start: the time and peak memory of a fresh Python process loading the app up to the login screen,
+and of a process that only imports mello_functions (what each bcrypt or chart worker does).
+
+Each measurement runs in a new process so nothing is already imported. Pass --baseline with a git ref to measure
+that version of the app too and print both side by side:
+
+    python scripts/bench_imports.py --baseline HEAD~1 [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries worth reporting when they end up loaded
+HEAVY_MODULES = ("snowflake.connector", "openai", "matplotlib", "seaborn", "pygame", "bs4", "requests",
+                 "streamlit_calendar")
+
+# Runs inside the measured process; the working directory is the app folder being measured
+PROBE = """
+import json, os, resource, sys, time
+started = time.perf_counter()
+sys.path.insert(0, os.getcwd())
+if sys.argv[1] == "login":
+    # Bare mode: renders the login screen without a server, as the first run of a session does
+    import streamlit_app
+else:
+    import mello_functions
+elapsed_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({"ms": elapsed_ms, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "loaded": [name for name in json.loads(sys.argv[2]) if name in sys.modules]}))
+"""
+
+TARGETS = {"login": "login screen (streamlit_app)", "functions": "worker import (mello_functions)"}
+
+
+def measure(app_dir: str, target: str, runs: int) -> dict:
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", PROBE, target, json.dumps(HEAVY_MODULES)], cwd=app_dir,
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    return {"ms": statistics.median(result["ms"] for result in results),
+            "rss_mb": statistics.median(result["rss_mb"] for result in results),
+            "loaded": results[-1]["loaded"]}
+
+
+def export_ref(ref: str, destination: str):
+    # Copies the tracked files at ref into destination, leaving the working tree alone
+    archive = subprocess.run(["git", "archive", ref], cwd=REPO_ROOT, capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", destination], input=archive, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--baseline", help="git ref to compare against, e.g. HEAD~1")
+    parser.add_argument("--runs", type=int, default=5, help="processes per measurement (median is reported)")
+    args = parser.parse_args()
+
+    versions = {"current": REPO_ROOT}
+    with tempfile.TemporaryDirectory() as baseline_dir:
+        if args.baseline:
+            export_ref(args.baseline, baseline_dir)
+
+            # Secrets and local settings aren't tracked, so reuse the working tree's
+            streamlit_dir = os.path.join(REPO_ROOT, ".streamlit")
+            if os.path.isdir(streamlit_dir):
+                subprocess.run(["cp", "-r", streamlit_dir, baseline_dir], check=True)
+            versions = {args.baseline: baseline_dir, **versions}
+
+        print(f"{'target':<32} {'version':<12} {'ms':>8} {'peak RSS MB':>12}  heavy modules loaded")
+        for target, label in TARGETS.items():
+            for version, app_dir in versions.items():
+                result = measure(app_dir, target, args.runs)
+                loaded = ", ".join(result["loaded"]) or "-"
+                print(f"{label:<32} {version:<12} {result['ms']:>8.0f} {result['rss_mb']:>12.1f}  {loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Builds display-sized, compressed copies of the app's images and writes the manifest the app reads at runtime.
+
+Each asset is resized to twice the largest size it is shown at (so it stays sharp on high-density screens),
+then saved as an optimised PNG (or GIF for animations) and a WebP. The results go to assets/optimized/
+together with manifest.json, which mello_functions.resolve_asset() uses to swap in the smaller file.
+
+Run it whenever an image in assets/ changes (add --report to only print the savings of the current build):
+
+    python scripts/build_assets.py
+"""
+import json
+import os
+import sys
+
+from PIL import Image, ImageSequence
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = "assets/optimized"
+MANIFEST_PATH = f"{OUTPUT_DIR}/manifest.json"
+
+# Assets are exported at this multiple of their CSS size
+PIXEL_DENSITY = 2
+
+# CSS sizes (px) each helper displays its image at
+TITLE_IMAGE_SIZE = 120  # page_title
+HOME_TITLE_IMAGE_SIZE = 200  # home page title
+KPI_ICON_SIZE = 100  # kpi_card
+LOGIN_GIF_SIZE = 300  # login screen
+SUCCESS_ICON_SIZE = 35  # journal success banner
+
+EMOTION_ICONS = [f"assets/mimi-icons/{name}-mimi.png" for name in ("angry", "fear", "happy", "sad", "suprised")]
+
+# Images each page renders, with the CSS size they are shown at
+PAGE_ASSETS = {
+    "login": {"assets/changing-mimi.gif": LOGIN_GIF_SIZE},
+    "home": {"assets/mimi-icons/flower-mimi.png": HOME_TITLE_IMAGE_SIZE},
+    "journal": {"assets/mimi-icons/journal-mimi.png": TITLE_IMAGE_SIZE,
+                "assets/mimi-icons/super-mimi.png": SUCCESS_ICON_SIZE},
+    "calendar": {"assets/mimi-icons/habit-mimi.png": TITLE_IMAGE_SIZE},
+    "mimi": {"assets/mimi-icons/mimi-mimi.png": TITLE_IMAGE_SIZE},
+    "about": {"assets/mimi-icons/about-mimi.png": TITLE_IMAGE_SIZE},
+    "dashboard": {"assets/mimi-icons/dashboard-mimi.png": TITLE_IMAGE_SIZE,
+                  "assets/mimi-icons/about-mimi.png": KPI_ICON_SIZE,
+                  **{path: KPI_ICON_SIZE for path in EMOTION_ICONS},
+                  "assets/mimi-icons/coffee-mimi.png": KPI_ICON_SIZE,
+                  "assets/mimi-icons/spa-mimi.png": KPI_ICON_SIZE,
+                  "assets/trophy-icon.png": KPI_ICON_SIZE,
+                  "assets/fire-icon.png": KPI_ICON_SIZE},
+}
+
+# The dashboard shows one emotion icon and one to-do icon at a time, so the report skips the alternatives
+# to the about-mimi and coffee-mimi icons it counts
+DASHBOARD_ALTERNATIVES = [*EMOTION_ICONS, "assets/mimi-icons/spa-mimi.png"]
+
+WEBP_QUALITY = 85
+
+
+def display_sizes() -> dict:
+    """
+    Returns the largest CSS size each asset is displayed at, across all pages.
+    """
+    sizes = {}
+    for page_assets in PAGE_ASSETS.values():
+        for path, size in page_assets.items():
+            sizes[path] = max(size, sizes.get(path, 0))
+    return sizes
+
+
+def output_path(source_path: str, width: int, extension: str) -> str:
+    # assets/mimi-icons/happy-mimi.png -> assets/optimized/mimi-icons/happy-mimi.200.webp
+    relative_path = os.path.relpath(source_path, "assets")
+    stem = os.path.splitext(relative_path)[0]
+    return f"{OUTPUT_DIR}/{stem}.{width}.{extension}".replace(os.sep, "/")
+
+
+def target_size(image: Image.Image, css_size: int) -> tuple:
+    """
+    Scales the image so its longest side is css_size * PIXEL_DENSITY, never enlarging it.
+    """
+    longest_side = css_size * PIXEL_DENSITY
+    scale = min(1.0, longest_side / max(image.size))
+    return max(1, round(image.width * scale)), max(1, round(image.height * scale))
+
+
+def build_still(source_path: str, css_size: int) -> dict:
+    with Image.open(os.path.join(REPO_ROOT, source_path)) as image:
+        image = image.convert("RGBA")
+        size = target_size(image, css_size)
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS)
+
+        outputs = {"png": output_path(source_path, size[0], "png"), "webp": output_path(source_path, size[0], "webp")}
+        image.save(os.path.join(REPO_ROOT, outputs["png"]), optimize=True)
+        image.save(os.path.join(REPO_ROOT, outputs["webp"]), quality=WEBP_QUALITY, method=6)
+
+    return {"width": size[0], "height": size[1], "formats": outputs}
+
+
+def build_animation(source_path: str, css_size: int) -> dict:
+    with Image.open(os.path.join(REPO_ROOT, source_path)) as image:
+        size = target_size(image, css_size)
+        frames, durations = [], []
+        for frame in ImageSequence.Iterator(image):
+            durations.append(frame.info.get("duration", 100))
+            frames.append(frame.convert("RGBA").resize(size, Image.LANCZOS))
+        loop = image.info.get("loop", 0)
+
+    outputs = {"gif": output_path(source_path, size[0], "gif"), "webp": output_path(source_path, size[0], "webp")}
+    frames[0].save(os.path.join(REPO_ROOT, outputs["gif"]), save_all=True, append_images=frames[1:],
+                   duration=durations, loop=loop, optimize=True, disposal=2)
+    frames[0].save(os.path.join(REPO_ROOT, outputs["webp"]), save_all=True, append_images=frames[1:],
+                   duration=durations, loop=loop, quality=WEBP_QUALITY, method=6)
+
+    return {"width": size[0], "height": size[1], "formats": outputs}
+
+
+def build_assets() -> dict:
+    """
+    Builds every asset listed in PAGE_ASSETS and writes the manifest.
+
+    Returns:
+        dict: The manifest, keyed by the source asset path.
+    """
+    manifest = {}
+    for source_path, css_size in sorted(display_sizes().items()):
+        os.makedirs(os.path.dirname(os.path.join(REPO_ROOT, output_path(source_path, 1, "png"))), exist_ok=True)
+
+        if source_path.endswith(".gif"):
+            entry = build_animation(source_path, css_size)
+        else:
+            entry = build_still(source_path, css_size)
+
+        entry["source_bytes"] = os.path.getsize(os.path.join(REPO_ROOT, source_path))
+        entry["bytes"] = {fmt: os.path.getsize(os.path.join(REPO_ROOT, path)) for fmt, path in entry["formats"].items()}
+        manifest[source_path] = entry
+
+    with open(os.path.join(REPO_ROOT, MANIFEST_PATH), "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        manifest_file.write("\n")
+
+    return manifest
+
+
+def page_render_bytes(manifest: dict, page: str, fmt: str = None) -> int:
+    """
+    Returns the image bytes one render of a page sends, using the given output format (None for the originals).
+
+    Only one emotion icon and one to-do icon are counted for the dashboard, since a render shows one of each.
+    """
+    total = 0
+    for path in PAGE_ASSETS[page]:
+        if page == "dashboard" and path in DASHBOARD_ALTERNATIVES:
+            continue
+        entry = manifest[path]
+        if fmt is None:
+            total += entry["source_bytes"]
+        else:
+            # Animations have no PNG, so fall back to their GIF
+            total += entry["bytes"].get(fmt, entry["bytes"].get("gif", entry["source_bytes"]))
+    return total
+
+
+def print_report(manifest: dict):
+    print(f"{'asset':<45} {'size':>9} {'original':>10} {'png/gif':>10} {'webp':>10}")
+    for path, entry in manifest.items():
+        fallback = entry["bytes"].get("png", entry["bytes"].get("gif"))
+        print(f"{path:<45} {entry['width']:>4}x{entry['height']:<4} {entry['source_bytes']:>10,} {fallback:>10,} "
+              f"{entry['bytes']['webp']:>10,}")
+
+    # Inline mode sends images as base64, which is a third bigger than the files themselves
+    print("\nBytes per page render (inline mode adds ~33% on top)")
+    print(f"{'page':<12} {'original':>10} {'png/gif':>10} {'webp':>10} {'saved':>10}")
+    totals = [0, 0, 0]
+    for page in PAGE_ASSETS:
+        original = page_render_bytes(manifest, page)
+        fallback = page_render_bytes(manifest, page, "png")
+        webp = page_render_bytes(manifest, page, "webp")
+        totals = [totals[0] + original, totals[1] + fallback, totals[2] + webp]
+        print(f"{page:<12} {original:>10,} {fallback:>10,} {webp:>10,} {original - webp:>10,}")
+    print(f"{'total':<12} {totals[0]:>10,} {totals[1]:>10,} {totals[2]:>10,} {totals[0] - totals[2]:>10,}")
+
+
+if __name__ == "__main__":
+    missing = [path for path in display_sizes() if not os.path.exists(os.path.join(REPO_ROOT, path))]
+    if missing:
+        sys.exit(f"Missing source assets: {', '.join(missing)}")
+
+    if "--report" in sys.argv[1:]:
+        with open(os.path.join(REPO_ROOT, MANIFEST_PATH), encoding="utf-8") as manifest_file:
+            print_report(json.load(manifest_file))
+    else:
+        print_report(build_assets())
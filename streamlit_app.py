@@ -4,23 +4,14 @@ import mello_functions as mf
 import pandas as pd
 
 
-from Pages.home import display_home
-from Pages.journal import display_journal
-from Pages.mimi import display_mimi
-from Pages.habit import display_habit
-from Pages.dashboard import display_dashboard
-from Pages.about import display_about
-
 # Set the page configuration to wide layout
 st.set_page_config(layout="wide", initial_sidebar_state="collapsed")
 
-def set_session_user(username):
-
-    user_info = mf.query_select("user_accounts", username = username, columns = ("name", "user_id"))
+def set_session_user(username, user_id, name):
 
     st.session_state['username'] = username#[0]
-    st.session_state['user_id'] = user_info['user_id'.upper()][0]
-    st.session_state['name'] = user_info['name'.upper()][0]
+    st.session_state['user_id'] = user_id
+    st.session_state['name'] = name
 
     st.rerun()
 
@@ -31,40 +22,18 @@ def get_user(username, check_exists = True):
     else:
         return user_details
 
-# Inject custom CSS for Google Fonts
-st.markdown(
-    """
-    <style>
-        /* Import DM Serif Display and Pacifico from Google Fonts */
-        @import url('https://fonts.googleapis.com/css2?family=DM+Serif+Display:ital@0;1&family=Pacifico&display=swap');
-
-        /* Apply font classes */
-        .dm-serif-display {
-            font-family: 'DM Serif Display', serif;
-        }
-
-        .pacifico {
-            font-family: 'Pacifico', cursive;
-        }
-
-        /* Center text styling for demonstration */
-        .center-text {
-            text-align: center;
-        }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
+# Add the shared stylesheet (fonts, titles, cards, chat) once for this render
+mf.inject_styles()
 
 # User authentication
 if 'username' not in st.session_state:
     
     # Add changing mimi gif at the top
-    changing_mimi = mf.import_html_media("assets/changing-mimi.gif")
+    changing_mimi = mf.media_src("assets/changing-mimi.gif")
     st.markdown(
                     f"""
-                    <div style="display: flex; justify-content: center; align-items: center; height: 400px;">
-                        <img src="data:image/gif;base64,{changing_mimi}" style="width: 300px; height: 300px;" />
+                    <div class="login-gif-container">
+                        <img class="login-gif" src="{changing_mimi}" />
                     </div>
                     """,
                     unsafe_allow_html=True,
@@ -98,18 +67,22 @@ if 'username' not in st.session_state:
 
             if login_button:
                 
-                # Get user details and whether the user exists
+                # Get user details and whether the user exists (one query for everything login needs)
                 user_details, user_exists = get_user(username, check_exists= True)
-                stored_hash = user_details['PASSWORD_HASH'][0]
 
                 if user_exists:
                     # Verify login details
+                    stored_hash = user_details['PASSWORD_HASH'][0]
                     correct_password = mf.verify_password(password, stored_hash)
 
                     if correct_password:
 
+                        # Upgrade the stored hash if the configured bcrypt cost has changed
+                        if mf.password_needs_rehash(stored_hash):
+                            mf.update_data("user_accounts", "password_hash", mf.hash_password(password), "user_id", int(user_details['USER_ID'][0]))
+
                         st.success("Success! Logging in...")
-                        set_session_user(username)
+                        set_session_user(username, user_details['USER_ID'][0], user_details['NAME'][0])
 
                     else:
                         "Incorrect password. Try again"
@@ -141,13 +114,16 @@ if 'username' not in st.session_state:
                     if password != confirm_password:
                         st.error("Passwords do not match")
                     else:
-                        # insert the user details
+                        # insert the user details and get the new user's id back
                         hashed = mf.hash_password(password)
-                        mf.insert_data("user_accounts", columns = ('USERNAME', 'NAME', 'DATA_PERMISSION', 'PASSWORD_HASH'), data = (username, name, data_permission, hashed))
+                        user_id = mf.insert_data("user_accounts", columns = ('USERNAME', 'NAME', 'DATA_PERMISSION', 'PASSWORD_HASH'), data = (username, name, data_permission, hashed), returning = 'USER_ID')
 
-                        st.success("Account created! Logging in...")
+                        if user_id is None:
+                            st.error("Could not create your account, please try again.")
+                        else:
+                            st.success("Account created! Logging in...")
 
-                        set_session_user(username)
+                            set_session_user(username, user_id, name)
 
 else:
     page_container = st.container()
@@ -160,21 +136,31 @@ else:
         orientation = "horizontal"
     )
 
+    # Pages are imported when first opened, so the login screen doesn't load their libraries
     if selected == "Home":
+        from Pages.home import display_home
         with page_container:
             display_home()
     elif selected == "Journal":
+        from Pages.journal import display_journal
         with page_container:
             display_journal()
     elif selected == "Mimi":
+        from Pages.mimi import display_mimi
         with page_container:
             display_mimi()
     elif selected == 'Dashboard':
+        from Pages.dashboard import display_dashboard
         with page_container:
             display_dashboard()
     elif selected == "Habits/Calendar":
+        from Pages.habit import display_habit
         with page_container:
             display_habit()
     elif selected == "About":
+        from Pages.about import display_about
         with page_container:
             display_about()
+
+# Hidden performance panel (see mf.show_debug_panel)
+mf.show_debug_panel()